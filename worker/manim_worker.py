@@ -1,16 +1,28 @@
 import os
+import re
 import sys
+import ast
+import time
+import asyncio
 import json
 import uuid
+import signal
+import hashlib
+import logging
 import shutil
 import subprocess
-import tempfile
+from collections import deque
 from pathlib import Path
+from contextlib import asynccontextmanager
 from typing import Dict, Any
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import FileResponse
 from pydantic import BaseModel
+from cachetools import LRUCache, TTLCache
 import uvicorn
 
+from mp4_concat import concat_mp4, Mp4ConcatError
+
 # Manim imports
 try:
     from manim import *
@@ -20,16 +32,131 @@ except ImportError as e:
     print("📋 To install Manim, run: pip install manim")
     sys.exit(1)
 
-app = FastAPI(title="3D Avatar Manim Worker", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app):
+    """Start the render processes with the server so no request waits for Manim to import"""
+    # Scratch directories left behind by a previous run are never needed again
+    await asyncio.to_thread(shutil.rmtree, WORK_ROOT, ignore_errors=True)
+    WORK_ROOT.mkdir(parents=True, exist_ok=True)
+    # Likewise hidden partial videos in OUTPUT_DIR from copies cut short by a crash
+    for partial in OUTPUT_DIR.glob(".*.mp4"):
+        partial.unlink(missing_ok=True)
+    await asyncio.gather(*(renderer.start() for renderer in RENDER_POOL))
+    pruner = asyncio.create_task(prune_video_cache_periodically()) if VIDEO_CACHE_BYTES else None
+    yield
+    if pruner:
+        pruner.cancel()
+    await asyncio.gather(*(renderer.stop() for renderer in RENDER_POOL))
+    await asyncio.gather(*CLEANUP_TASKS)
+
+app = FastAPI(title="3D Avatar Manim Worker", version="1.0.0", lifespan=lifespan)
 
 # Configuration
+# Set AI_TUTOR_DEBUG=1 to log the full Manim code of every request
+DEBUG_MODE = os.environ.get("AI_TUTOR_DEBUG") == "1"
+
+logger = logging.getLogger("manim_worker")
+logger.setLevel(logging.DEBUG if DEBUG_MODE else logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+logger.propagate = False
+
 OUTPUT_DIR = Path(__file__).parent.parent / "uploads" / "videos"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Manim media directory shared across requests so its partial-movie cache
+# survives between renders of identical scenes; when SCRATCH_ROOT is in use
+# only the Tex cache is kept here
+CACHE_DIR = Path(__file__).parent.parent / "manim_cache"
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# Compiled Tex/MathTex SVGs, kept across restarts and shared by all render
+# processes; Manim names each file after a hash of the LaTeX source, so a
+# formula is only compiled once. Every process compiles in its own
+# subdirectory because Manim deletes all non-SVG files in its tex_dir after
+# each compile, including another process's in-flight .dvi/.aux files, and
+# then moves the finished SVG up into TEX_DIR.
+TEX_DIR = CACHE_DIR / "Tex"
+TEX_DIR.mkdir(parents=True, exist_ok=True)
+
+# Minimum free space for /dev/shm to be used as scratch space by default
+SHM_MIN_FREE = 2 * 1024 ** 3
+
+def select_scratch_root():
+    """Pick the directory for render intermediates: AI_TUTOR_TMP, else /dev/shm when it has room, else None"""
+    # Named per checkout, so two workers on one host never share render
+    # directories or clear each other's work directories at startup
+    name = f"ai_tutor_{hashlib.blake2b(str(OUTPUT_DIR.resolve()).encode('utf-8'), digest_size=4).hexdigest()}"
+    configured = os.environ.get("AI_TUTOR_TMP")
+    if configured:
+        return Path(configured) / name
+    shm = Path("/dev/shm")
+    if shm.is_dir() and shutil.disk_usage(shm).free > SHM_MIN_FREE:
+        return shm / name
+    return None
+
+SCRATCH_ROOT = select_scratch_root()
+
+# Per-request scratch directories. Without a scratch root they sit on the same
+# filesystem as OUTPUT_DIR so finished videos can be renamed into place; on
+# tmpfs the final copy is cheap next to the many small files a render writes
+WORK_ROOT = (SCRATCH_ROOT or OUTPUT_DIR.parent) / "work"
+WORK_ROOT.mkdir(parents=True, exist_ok=True)
+
+# Media directories of the render processes, where Manim writes its partial movies
+RENDER_MEDIA_ROOT = SCRATCH_ROOT / "media" if SCRATCH_ROOT else CACHE_DIR
+
+# Concurrency limits; Manim and libx264 are both multi-threaded, so running
+# one job per core would oversubscribe the CPU. The number of render processes
+# can be set with AI_TUTOR_MANIM_WORKERS (e.g. on machines with plenty of RAM).
+def env_int(name):
+    """Read a positive integer setting from the environment, or None (with a warning if it is invalid)"""
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        print(f"⚠️ Ignoring {name}={value!r}: expected a positive whole number")
+        return None
+    return number
+
+MANIM_CONCURRENCY = env_int("AI_TUTOR_MANIM_WORKERS") or max(1, (os.cpu_count() or 1) // 4)
+FFMPEG_CONCURRENCY = max(1, (os.cpu_count() or 1) // 2)
+
+FFMPEG_SEM = asyncio.Semaphore(FFMPEG_CONCURRENCY)
+
+# Encoder threads per FFmpeg job, so that concurrent encodes together roughly fill the cores
+FFMPEG_THREADS = max(2, (os.cpu_count() or 1) // FFMPEG_CONCURRENCY)
+
+# Manim quality flags and the output folder each one renders into
+QUALITY_DIRS = {
+    "l": "480p15",
+    "m": "720p30",
+    "h": "1080p60",
+    "k": "2160p60"
+}
+
+# Descriptive names accepted in place of the flags
+QUALITY_NAMES = {
+    "low": "l",
+    "medium": "m",
+    "high": "h",
+    "4k": "k"
+}
+
 class ManimRequest(BaseModel):
     manimCode: str
     messageId: str = None
     narrationAudio: str = None  # Path to narration audio file
+    quality: str = "m"  # One of QUALITY_DIRS or QUALITY_NAMES; 720p30 is plenty for interactive playback
+
+class BatchManimRequest(BaseModel):
+    scenes: list[str]  # Manim code for each clip, in playback order
+    messageId: str = None
+    quality: str = "m"
+    combine: bool = True  # Also concatenate the clips into one video
 
 class CombineVideosRequest(BaseModel):
     videoPaths: list[str]
@@ -41,6 +168,9 @@ class ManimResponse(BaseModel):
     videoUrl: str = None
     error: str = None
     progress: str = None
+    resolution: str = None
+    videoPaths: list[str] = None  # Individual clips of a batch request
+    videoUrls: list[str] = None
 
 def check_ffmpeg():
     """Check if FFmpeg is available"""
@@ -51,17 +181,578 @@ def check_ffmpeg():
     except (subprocess.CalledProcessError, FileNotFoundError):
         return False
 
+def list_ffmpeg(kind):
+    """Return FFmpeg's list of encoders or filters, or an empty listing if FFmpeg cannot run"""
+    try:
+        result = subprocess.run(["ffmpeg", "-hide_banner", f"-{kind}"],
+                                capture_output=True, check=True)
+        return result.stdout
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return b""
+
+def select_hwaccel():
+    """Pick the GPU used for re-encoding from AI_TUTOR_HWACCEL (auto, cuda, vaapi or none)"""
+    requested = os.environ.get("AI_TUTOR_HWACCEL", "auto")
+    available = {"cuda": NVENC_AVAILABLE, "vaapi": VAAPI_AVAILABLE}
+    if requested == "auto":
+        return next((name for name, usable in available.items() if usable), "none")
+    if requested == "none":
+        return "none"
+    if not available.get(requested):
+        print(f"⚠️ AI_TUTOR_HWACCEL={requested} is not usable with this FFmpeg, re-encoding on the CPU.")
+        return "none"
+    return requested
+
+def check_latex():
+    """Check if the LaTeX tools Manim uses for Tex/MathTex are installed"""
+    return shutil.which("latex") is not None and shutil.which("dvisvgm") is not None
+
 FFMPEG_AVAILABLE = check_ffmpeg()
+FFPROBE_AVAILABLE = shutil.which("ffprobe") is not None
 if not FFMPEG_AVAILABLE:
     print("⚠️ FFmpeg not found. Videos will be generated without proper encoding.")
 
-# Global progress tracking
-progress_tracker = {}
+FFMPEG_ENCODERS = list_ffmpeg("encoders") if FFMPEG_AVAILABLE else b""
+NVENC_AVAILABLE = b"h264_nvenc" in FFMPEG_ENCODERS
+VAAPI_DEVICE = os.environ.get("AI_TUTOR_VAAPI_DEVICE", "/dev/dri/renderD128")
+VAAPI_AVAILABLE = b"h264_vaapi" in FFMPEG_ENCODERS and Path(VAAPI_DEVICE).exists()
+HWACCEL = select_hwaccel()
+# Lets the NVENC fallback convert pixel formats without copying frames off the GPU
+SCALE_CUDA_AVAILABLE = HWACCEL == "cuda" and b"scale_cuda" in list_ffmpeg("filters")
+
+# Checked once at startup; installing LaTeX requires a worker restart
+LATEX_AVAILABLE = check_latex()
+if not LATEX_AVAILABLE:
+    print("⚠️ LaTeX not found. Scenes that need it will be rejected before rendering.")
+
+# Optional MathJax typesetting for MathTex (see render_worker.py); needs Node.js
+# and `npm install` in worker/mathjax
+MATHJAX_DIR = Path(__file__).parent / "mathjax"
+MATHJAX_AVAILABLE = (
+    os.environ.get("AI_TUTOR_MATHJAX") == "1"
+    and shutil.which("node") is not None
+    and (MATHJAX_DIR / "node_modules" / "mathjax-full").exists()
+)
+if os.environ.get("AI_TUTOR_MATHJAX") == "1" and not MATHJAX_AVAILABLE:
+    print("⚠️ AI_TUTOR_MATHJAX=1 but Node.js or mathjax-full is missing, using LaTeX for all Tex.")
+
+# Re-encoding is only needed when clips were not produced by generate_video
+# (which normalizes its output), so it can be disabled to fail fast instead
+REENCODE_FALLBACK = os.environ.get("AI_TUTOR_REENCODE_FALLBACK", "1") != "0"
+
+# Shared MP4 video track timescale for every generated clip
+VIDEO_TRACK_TIMESCALE = "15360"
+
+# Keyframe interval for every re-encode, so seeking in the browser is quick and
+# consistent whatever the encoder's scene-cut decisions
+KEYFRAME_ARGS = ["-g", "60", "-keyint_min", "60"]
+
+def build_video_encode_args(hwaccel=HWACCEL):
+    """Encoder options producing browser-friendly H.264, on the GPU selected by hwaccel when there is one"""
+    if hwaccel == "cuda":
+        return ["-pix_fmt", "yuv420p", "-c:v", "h264_nvenc", "-preset", "p4", "-rc", "vbr", "-cq", "23", *KEYFRAME_ARGS]
+    if hwaccel == "vaapi":
+        # Frames are decoded in system memory and uploaded to the device given with -vaapi_device
+        return ["-vf", "format=nv12,hwupload", "-c:v", "h264_vaapi", "-qp", "23", *KEYFRAME_ARGS]
+    return [
+        "-pix_fmt", "yuv420p",
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-tune", "animation",
+        "-crf", "23",
+        *KEYFRAME_ARGS,
+        "-threads", str(FFMPEG_THREADS),
+        "-filter_threads", str(FFMPEG_THREADS),
+        "-x264-params", "sliced-threads=0:rc-lookahead=20"
+    ]
+
+def build_remux_command(video_path, output_path, audio_path=None, reencode=False, hwaccel=HWACCEL):
+    """Build the FFmpeg command that remuxes a Manim render into the common clip layout
+    
+    With reencode, the video is converted to H.264 in the same pass that adds the audio.
+    """
+    cmd = ["ffmpeg", "-y"]
+    if reencode and hwaccel == "vaapi":
+        cmd += ["-vaapi_device", VAAPI_DEVICE]
+    cmd += ["-i", str(video_path)]
+    if audio_path:
+        cmd += [
+            "-i", str(audio_path),
+            "-map", "0:v:0",  # Map video from first input
+            "-map", "1:a:0",  # Map audio from second input
+            "-c:a", "aac",    # Encode audio as AAC
+            "-shortest"       # End when shortest stream ends
+        ]
+    else:
+        # Keep any sound the scene added itself (self.add_sound); .mov renders may carry PCM
+        cmd += ["-map", "0:v:0", "-map", "0:a:0?", "-c:a", "aac"]
+    # Copy the video stream unless it is not already playable H.264
+    cmd += build_video_encode_args(hwaccel) if reencode else ["-c:v", "copy"]
+    cmd += [
+        "-video_track_timescale", VIDEO_TRACK_TIMESCALE,
+        "-movflags", "+faststart",
+        str(output_path)
+    ]
+    return cmd
+
+# Start every child in its own process group so a timeout can kill whatever it spawned
+# (LaTeX, dvisvgm and MathJax under a render process) along with it
+if os.name == "posix":
+    PROCESS_GROUP_OPTIONS = {"start_new_session": True}
+else:
+    PROCESS_GROUP_OPTIONS = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+
+async def kill_process_tree(proc):
+    """Kill a child started with PROCESS_GROUP_OPTIONS together with its descendants, and reap it"""
+    if proc.returncode is None:
+        if os.name == "posix":
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        else:
+            killer = await asyncio.create_subprocess_exec(
+                "taskkill", "/F", "/T", "/PID", str(proc.pid),
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+            await killer.wait()
+            if proc.returncode is None:
+                proc.kill()
+    await proc.wait()
+
+STDERR_TAIL_BYTES = 16 * 1024
+
+async def read_tail(stream, limit=STDERR_TAIL_BYTES):
+    """Read a stream to the end, keeping only about its last limit bytes"""
+    lines = deque()
+    size = 0
+    async for line in stream:
+        lines.append(line)
+        size += len(line)
+        while size > limit and len(lines) > 1:
+            size -= len(lines.popleft())
+    return b"".join(lines)[-limit:]
+
+async def run_command(cmd, cwd=None, timeout=300, on_progress=None, input=None):
+    """Run a command without blocking the event loop, returning a CompletedProcess with text output
+    
+    When on_progress is given, stdout is parsed as FFmpeg `-progress` key=value
+    blocks and each completed block is passed to it as a dict. input (bytes)
+    is written to the command's stdin. Only the tail of stderr is kept.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        # Without a controlling terminal, FFmpeg must not try to read keys from stdin
+        stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=str(cwd) if cwd else None,
+        **PROCESS_GROUP_OPTIONS
+    )
+    
+    async def communicate():
+        # Drain both pipes while stdin is written so a chatty command cannot block on a full pipe
+        stderr_task = asyncio.ensure_future(read_tail(proc.stderr))
+        stdout_task = asyncio.ensure_future(proc.stdout.read()) if on_progress is None else None
+        if input is not None:
+            try:
+                proc.stdin.write(input)
+                await proc.stdin.drain()
+                proc.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The command exited early; its stderr says why
+        stdout = b""
+        if stdout_task is not None:
+            stdout = await stdout_task
+        else:
+            stats = {}
+            async for raw_line in proc.stdout:
+                key, _, value = raw_line.decode("utf-8", errors="replace").strip().partition("=")
+                stats[key] = value
+                if key == "progress":
+                    on_progress(stats)
+                    stats = {}
+        await proc.wait()
+        return stdout, await stderr_task
+    
+    try:
+        stdout, stderr = await asyncio.wait_for(communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        await kill_process_tree(proc)
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    return subprocess.CompletedProcess(
+        cmd,
+        proc.returncode,
+        stdout.decode("utf-8", errors="replace"),
+        stderr.decode("utf-8", errors="replace")
+    )
+
+def parse_number(value, kind=float):
+    """Parse a number from FFmpeg's progress output, which reports N/A for unknown values"""
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+async def run_ffmpeg(cmd, cwd=None, timeout=300, request_id=None, label=None, input=None):
+    """Run an FFmpeg command once a concurrency slot is free, publishing its progress for request_id"""
+    on_progress = None
+    # Only errors are worth reading; progress comes from -progress instead of the stats line
+    cmd = [cmd[0], "-loglevel", "error", "-nostats", *cmd[1:]]
+    if request_id:
+        cmd = [cmd[0], "-progress", "pipe:1", *cmd[1:]]
+        
+        def on_progress(stats):
+            out_time = stats.get("out_time", "").split(".")[0]
+            # out_time_ms is in microseconds too (an old FFmpeg quirk), so prefer out_time_us
+            out_time_us = parse_number(stats.get("out_time_us", stats.get("out_time_ms")), int)
+            progress_tracker[request_id] = {
+                "progress": (
+                    f"{label} ({out_time} processed, frame {stats.get('frame', '?')}, "
+                    f"speed {stats.get('speed', '?').strip()})"
+                ),
+                "phase": "encoding",
+                "out_time_ms": out_time_us // 1000 if out_time_us is not None else None,
+                "frame": parse_number(stats.get("frame"), int),
+                "speed": parse_number(stats.get("speed", "").strip().rstrip("x"))
+            }
+    
+    async with FFMPEG_SEM:
+        return await run_command(cmd, cwd=cwd, timeout=timeout, on_progress=on_progress, input=input)
+
+class RenderProcess:
+    """A long-lived render_worker.py child that keeps Manim imported between renders"""
+    
+    def __init__(self, media_dir, tex_dir, cpus=None):
+        # Manim rewrites its partial-movie list and evicts old cache files in
+        # place, so every render process owns a separate media directory
+        self.media_dir = media_dir
+        self.media_dir.mkdir(parents=True, exist_ok=True)
+        self.tex_dir = tex_dir
+        self.tex_dir.mkdir(parents=True, exist_ok=True)
+        self.cpus = cpus
+        self.proc = None
+    
+    async def start(self):
+        self.proc = await asyncio.create_subprocess_exec(
+            sys.executable, str(RENDER_WORKER_SCRIPT),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=RENDER_REPLY_LIMIT,
+            env={**os.environ, "AI_TUTOR_MATHJAX": "1" if MATHJAX_AVAILABLE else "0", "AI_TUTOR_TEX_DIR": str(TEX_DIR)},
+            **PROCESS_GROUP_OPTIONS
+        )
+        if self.cpus:
+            # Keep concurrent renders on separate cores instead of migrating across all of them
+            try:
+                os.sched_setaffinity(self.proc.pid, self.cpus)
+            except OSError as e:
+                print(f"⚠️ Could not pin render process {self.proc.pid} to CPUs {sorted(self.cpus)}: {e}")
+        print(f"🚀 Started render process {self.proc.pid}" + (f" on CPUs {sorted(self.cpus)}" if self.cpus else ""))
+    
+    async def stop(self):
+        if self.proc:
+            await kill_process_tree(self.proc)
+        self.proc = None
+    
+    async def render(self, job, timeout=300, on_progress=None):
+        """Send a job to the child and wait for its reply, restarting the child if it hangs or dies
+        
+        on_progress is called with the number of animations rendered so far.
+        """
+        if self.proc is None or self.proc.returncode is not None:
+            await self.start()
+        job = {**job, "media_dir": str(self.media_dir), "tex_dir": str(self.tex_dir)}
+        self.proc.stdin.write((json.dumps(job) + "\n").encode("utf-8"))
+        try:
+            await self.proc.stdin.drain()
+            reply = await asyncio.wait_for(self.read_reply(on_progress), timeout=timeout)
+        except asyncio.TimeoutError:
+            await self.stop()
+            raise subprocess.TimeoutExpired(job["script"], timeout)
+        except (BrokenPipeError, ConnectionResetError):
+            reply = None
+        if reply is None:
+            await self.stop()
+            return {"success": False, "error": "Render process exited unexpectedly"}
+        if reply["success"] and not Path(reply["video"]).exists():
+            reply["video"] = str(self.find_video(job))
+        return reply
+    
+    async def read_reply(self, on_progress):
+        """Read the child's reply to the current job, passing progress lines to on_progress"""
+        while True:
+            line = await self.proc.stdout.readline()
+            if not line:
+                return None
+            message = json.loads(line)
+            if message.get("event") != "progress":
+                return message
+            if on_progress:
+                on_progress(message["animations"])
+    
+    def find_video(self, job):
+        """Look for a job's movie file when it is not at the path the child reported"""
+        # Manim writes to media_dir/videos/<script name>/<quality folder>/<output_file>.mp4
+        expected = (self.media_dir / "videos" / Path(job["script"]).stem /
+                    QUALITY_DIRS[job["quality"]] / f"{job['output_file']}.mp4")
+        if expected.exists():
+            return expected
+        # Only the two folder levels Manim uses are searched, never partial_movie_files
+        matches = list(self.media_dir.glob(f"videos/*/*/{job['output_file']}.*"))
+        return matches[0] if matches else expected
+
+RENDER_WORKER_SCRIPT = Path(__file__).parent / "render_worker.py"
+RENDER_REPLY_LIMIT = 4 * 1024 * 1024  # Replies carry full tracebacks
+
+def split_cpus(count):
+    """Split the CPUs this worker may use into count disjoint sets, or Nones where pinning is unavailable"""
+    if not hasattr(os, "sched_setaffinity") or os.environ.get("AI_TUTOR_PIN_CPUS") == "0":
+        return [None] * count
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < count:
+        return [None] * count
+    # Contiguous blocks keep each render on neighbouring cores that share caches
+    size, extra = divmod(len(cpus), count)
+    sets, start = [], 0
+    for slot in range(count):
+        end = start + size + (1 if slot < extra else 0)
+        sets.append(set(cpus[start:end]))
+        start = end
+    return sets
+
+# Pool of render processes; its size bounds how many renders run at once
+RENDER_POOL = [
+    RenderProcess(RENDER_MEDIA_ROOT / f"slot_{slot}", TEX_DIR / f"slot_{slot}", cpus)
+    for slot, cpus in enumerate(split_cpus(MANIM_CONCURRENCY))
+]
+RENDER_PROCESSES = asyncio.Queue()
+for renderer in RENDER_POOL:
+    RENDER_PROCESSES.put_nowait(renderer)
+
+@asynccontextmanager
+async def render_process():
+    """Borrow a render process, waiting while all of them are busy"""
+    renderer = await RENDER_PROCESSES.get()
+    try:
+        yield renderer
+    finally:
+        RENDER_PROCESSES.put_nowait(renderer)
+
+# Imports every scene gets; the scene's own copies are removed to avoid conflicts
+REQUIRED_IMPORTS = [
+    "from manim import *",
+    "from math import *", 
+    "import random",
+    "import numpy as np"
+]
+REPLACED_IMPORT_PREFIXES = (
+    "from manim import",
+    "from math import",
+    "import random",
+    "import numpy"
+)
+
+def normalize_manim_code(manim_code):
+    """Replace the scene's own imports with the standard set of required imports"""
+    # Remove any existing import lines to avoid conflicts
+    filtered_lines = [
+        line for line in manim_code.strip().split('\n')
+        if not line.lstrip().startswith(REPLACED_IMPORT_PREFIXES)
+    ]
+    
+    # Combine imports with cleaned code
+    return '\n'.join(REQUIRED_IMPORTS) + '\n\n' + '\n'.join(filtered_lines)
+
+# Mobjects that always compile LaTeX when created; with MathJax only the
+# text-mode ones still need a LaTeX installation
+LATEX_TEXT_MOBJECTS = {"Tex", "BulletedList", "Title"}
+LATEX_MOBJECTS = LATEX_TEXT_MOBJECTS | {
+    "MathTex", "SingleStringMathTex",
+    "Matrix", "DecimalMatrix", "IntegerMatrix", "MobjectMatrix"
+}
+
+# Manim's scene base classes; a class deriving from one of them is preferred as the scene to render
+SCENE_BASES = frozenset({
+    "Scene", "ThreeDScene", "SpecialThreeDScene", "MovingCameraScene",
+    "ZoomedScene", "VectorScene", "LinearTransformationScene"
+})
+
+def is_scene_class(node):
+    """Whether a class definition derives directly from one of Manim's scene classes"""
+    return any(
+        (base.id if isinstance(base, ast.Name) else getattr(base, "attr", None)) in SCENE_BASES
+        for base in node.bases
+    )
+
+def scene_class_name(manim_code):
+    """Name of the scene class to render: GenScene, or else the first scene class with a construct() method"""
+    try:
+        tree = ast.parse(manim_code)
+    except SyntaxError:
+        return "GenScene"  # validate_scene_code reports the syntax error
+    classes = [
+        node for node in tree.body
+        if isinstance(node, ast.ClassDef)
+        and any(isinstance(item, ast.FunctionDef) and item.name == "construct" for item in node.body)
+    ]
+    if not classes or any(node.name == "GenScene" for node in classes):
+        return "GenScene"
+    # Classes deriving from user-defined scene classes still count after the direct subclasses
+    return next((node.name for node in classes if is_scene_class(node)), classes[0].name)
+
+def validate_scene_code(manim_code, scene_name="GenScene", source=None):
+    """Check that the code parses and defines scene_name with a construct() method, returning an error message if not
+    
+    source is the code as submitted, before normalize_manim_code; syntax errors
+    are reported against its line numbers when it fails to parse as well.
+    """
+    try:
+        tree = ast.parse(manim_code)
+    except SyntaxError as e:
+        error = e
+        if source is not None:
+            try:
+                ast.parse(source)
+            except SyntaxError as source_error:
+                error = source_error
+        return f"Invalid Python syntax in Manim code: {error.msg} (line {error.lineno})"
+    
+    if not LATEX_AVAILABLE:
+        needs_latex = LATEX_TEXT_MOBJECTS if MATHJAX_AVAILABLE else LATEX_MOBJECTS
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and node.id in needs_latex:
+                return f"{node.id} requires LaTeX, which is not installed on this worker (use Text instead)"
+    
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and node.name == scene_name:
+            if any(isinstance(item, ast.FunctionDef) and item.name == "construct" for item in node.body):
+                return None
+    return f"{scene_name}(Scene) with construct() required"
+
+def new_work_dir():
+    """Create a scratch directory for one request"""
+    # Named by uuid rather than messageId, which comes from the client
+    work_dir = WORK_ROOT / uuid.uuid4().hex
+    work_dir.mkdir()
+    return work_dir
+
+# Pending background deletions; asyncio only keeps weak references to tasks
+CLEANUP_TASKS = set()
+
+def remove_work_dir(work_dir):
+    """Delete a request's scratch directory in the background so the response is not delayed"""
+    task = asyncio.create_task(asyncio.to_thread(shutil.rmtree, work_dir, ignore_errors=True))
+    CLEANUP_TASKS.add(task)
+    task.add_done_callback(CLEANUP_TASKS.discard)
+
+def write_file(path, data):
+    """Write bytes to a new private file with raw os.write calls, skipping Python's buffered text layer"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o600)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+def place_file(src, dst):
+    """Move a finished file into place, renaming when possible instead of copying"""
+    try:
+        os.replace(src, dst)
+    except OSError:
+        # Copy to a hidden name next to the destination first (like combine_into_output),
+        # so a half-written file is never served; the random part keeps two requests
+        # finishing the same video from sharing it
+        partial = Path(dst).with_name(f".{uuid.uuid4().hex[:8]}.{Path(dst).name}")
+        try:
+            shutil.copy2(src, partial)
+            os.replace(partial, dst)
+        finally:
+            partial.unlink(missing_ok=True)
+
+def cache_key(*parts):
+    """Hash the inputs that determine an output file into a short hex key"""
+    # Always BLAKE2b: changing the hash would orphan every cached video
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def cache_hit(path):
+    """Return whether a cached output exists, marking it as recently used"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    # Only the access time is refreshed: clip mtimes are part of combined videos' cache keys
+    os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+    return True
+
+# Total size of cached videos to keep in OUTPUT_DIR (AI_TUTOR_VIDEO_CACHE_MB, unlimited when unset)
+VIDEO_CACHE_BYTES = (env_int("AI_TUTOR_VIDEO_CACHE_MB") or 0) * 1024 * 1024
+VIDEO_CACHE_PRUNE_INTERVAL = 600
+# Also matches the uncached copies finalize_video publishes when a remux fails
+CACHED_VIDEO_RE = re.compile(r"(combined_)?video_[0-9a-f]{32}(_[0-9a-f]{8})?\.mp4")
+
+def prune_video_cache():
+    """Delete the least recently used cached videos until they fit in VIDEO_CACHE_BYTES"""
+    videos = []
+    with os.scandir(OUTPUT_DIR) as entries:
+        for entry in entries:
+            if CACHED_VIDEO_RE.fullmatch(entry.name):
+                stat = entry.stat()
+                videos.append((stat.st_atime_ns, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in videos)
+    removed = 0
+    for _, size, path in sorted(videos):
+        if total <= VIDEO_CACHE_BYTES:
+            break
+        Path(path).unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
+
+async def prune_video_cache_periodically():
+    while True:
+        removed = await asyncio.to_thread(prune_video_cache)
+        if removed:
+            print(f"🧹 Removed {removed} least recently used videos from the cache")
+        await asyncio.sleep(VIDEO_CACHE_PRUNE_INTERVAL)
+
+def file_fingerprint(path):
+    """Identify a file's current contents by its absolute path, size and modification time"""
+    # A single stat; raises FileNotFoundError for missing files
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+# Global progress tracking; entries expire an hour after their last update so a
+# long-running worker does not keep one entry per request forever. All updates
+# happen on the event loop, so no lock is needed.
+progress_tracker = TTLCache(maxsize=10_000, ttl=3600)
 
 @app.get("/progress/{request_id}")
 async def get_progress(request_id: str):
-    """Get progress for a specific request"""
-    return {"progress": progress_tracker.get(request_id, "Unknown request")}
+    """Get progress for a specific request
+    
+    Always has a "progress" message; while Manim or FFmpeg is running, the
+    structured fields they report (phase, animations, out_time_ms, ...) too.
+    """
+    progress = progress_tracker.get(request_id, "Unknown request")
+    return {"progress": progress} if isinstance(progress, str) else progress
+
+@app.get("/videos/{name}")
+async def get_video(name: str):
+    """Serve a finished video from OUTPUT_DIR (sent with sendfile where the platform has it)"""
+    # Only plain file names; hidden names are partial files still being written
+    if name != Path(name).name or "\\" in name or name.startswith("."):
+        raise HTTPException(status_code=404, detail="Video not found")
+    video_path = OUTPUT_DIR / name
+    if not video_path.is_file():
+        raise HTTPException(status_code=404, detail="Video not found")
+    return FileResponse(video_path, media_type="video/mp4")
 
 @app.get("/health")
 async def health_check():
@@ -69,132 +760,469 @@ async def health_check():
     return {
         "status": "healthy",
         "manim_available": True,
-        "ffmpeg_available": FFMPEG_AVAILABLE
+        "ffmpeg_available": FFMPEG_AVAILABLE,
+        "nvenc_available": NVENC_AVAILABLE,
+        "vaapi_available": VAAPI_AVAILABLE,
+        "hwaccel": HWACCEL,
+        "latex_available": LATEX_AVAILABLE,
+        "mathjax_available": MATHJAX_AVAILABLE
     }
 
-@app.post("/combine-videos", response_model=ManimResponse)
-async def combine_videos(request: CombineVideosRequest):
-    """Combine multiple video files into one final video"""
-    print(f"🎬 Received video combination request")
-    print(f"📝 Number of videos to combine: {len(request.videoPaths)}")
-    
-    # Generate unique identifier for this request
-    request_id = request.messageId or str(uuid.uuid4())
+def uncached_path(final_path):
+    """Return a unique sibling of final_path that no cache lookup will find"""
+    return final_path.with_name(f"{final_path.stem}_{uuid.uuid4().hex[:8]}{final_path.suffix}")
+
+async def finalize_video(generated_video, final_path, temp_dir, request_id, narration_path=None):
+    """Remux a rendered video into the common clip layout and publish it
     
-    # Track progress
-    progress_tracker[request_id] = "Preparing video combination..."
+    Returns the published path: final_path, or an uncached name when the remux
+    failed but the render itself is playable. Returns None when the render is
+    not browser-friendly and could not be converted.
+    """
+    # Handle narration audio embedding if provided; the finished video is built
+    # in the temp directory and only published under final_path once complete
+    finished_video = temp_dir / final_path.name
     
-    # Create temporary directory for this combination
-    temp_dir = Path(tempfile.mkdtemp(prefix=f"combine_videos_{request_id}_"))
+    if FFMPEG_AVAILABLE:
+        if narration_path:
+            print(f"🎵 Embedding narration audio: {narration_path}")
+            progress_tracker[request_id] = "Embedding narration audio..."
     
-    try:
-        progress_tracker[request_id] = "Verifying input videos..."
-        # Verify all input videos exist
-        for i, video_path in enumerate(request.videoPaths):
-            if not Path(video_path).exists():
-                progress_tracker[request_id] = f"Failed: Video {i+1} not found"
-                return ManimResponse(
-                    success=False,
-                    error=f"Video file not found: {video_path}"
-                )
-        
-        progress_tracker[request_id] = "Creating FFmpeg concat list..."
+        # Remux into the common clip layout (embedding narration in the same pass)
+        # so combine_videos can always concatenate with stream copy
+        reencode = await needs_reencode(generated_video)
+        # A GPU encode can still fail (device busy, session limit), so libx264 backs it up
+        # ("none" also stands for a stream copy, which needs no encoder at all)
+        encoders = [HWACCEL, "none"] if reencode and HWACCEL != "none" else ["none"]
+        if reencode:
+            print(f"🔄 Render is not browser-friendly H.264, re-encoding while remuxing")
         
-        # Create file list for FFmpeg concat
-        concat_file = temp_dir / "concat_list.txt"
-        with open(concat_file, 'w') as f:
-            for video_path in request.videoPaths:
-                # Use absolute paths for FFmpeg
-                abs_path = Path(video_path).resolve()
-                f.write(f"file '{abs_path}'\n")
-        
-        print(f"📄 Concat list created: {concat_file}")
-        
-        progress_tracker[request_id] = "Combining videos with FFmpeg..."
-        
-        # Output file path - use absolute path
-        final_filename = f"combined_video_{request_id}.mp4"
-        final_path = OUTPUT_DIR / final_filename
-        
-        # Ensure output directory exists
-        OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+        for audio_path in ([narration_path, None] if narration_path else [None]):
+            for hwaccel in encoders:
+                cmd_remux = build_remux_command(generated_video, finished_video, audio_path, reencode, hwaccel)
+                print(f"🔄 Normalizing video: {' '.join(cmd_remux)}")
+                remux_result = await run_ffmpeg(
+                    cmd_remux,
+                    # A stream copy takes seconds; a full re-encode scales with the render
+                    timeout=None if reencode else 60,
+                    request_id=request_id,
+                    label="Embedding narration audio..." if audio_path else "Finalizing video..."
+                )
+                if remux_result.returncode == 0:
+                    break
+                if hwaccel != "none":
+                    print(f"⚠️ {hwaccel} re-encoding failed, falling back to libx264: {remux_result.stderr[-500:]}")
+            if remux_result.returncode == 0:
+                if audio_path:
+                    print(f"✅ Successfully embedded narration audio")
+                break
+            if audio_path:
+                # Fall back to video without audio
+                print(f"⚠️ Audio embedding failed: {remux_result.stderr}")
         
-        # FFmpeg command to concatenate videos
-        # First try with copy (fastest), if it fails, fallback to re-encoding
+        if remux_result.returncode != 0:
+            print(f"⚠️ Video normalization failed: {remux_result.stderr}")
+            if reencode:
+                return None
+            # Publish the render as it is, but under a name no cache lookup
+            # finds, so the next request tries the remux again
+            finished_video = generated_video
+            final_path = uncached_path(final_path)
+        elif narration_path and not audio_path:
+            # The narration was dropped, so this is not what the cache key describes
+            final_path = uncached_path(final_path)
+    else:
+        # FFmpeg not available
+        finished_video = generated_video
+    
+    # Falls back to a full copy when the work directory is on another filesystem
+    await asyncio.to_thread(place_file, finished_video, final_path)
+    return final_path
+
+def concat_input_args():
+    """FFmpeg input options that read a concat list from stdin"""
+    return ["-protocol_whitelist", "file,pipe", "-f", "concat", "-safe", "0", "-i", "pipe:0"]
+
+# Stream parameters that must be identical for clips to be joined by stream copy
+VIDEO_PROBE_FIELDS = ("codec_name", "profile", "width", "height", "pix_fmt",
+                      "sample_aspect_ratio", "r_frame_rate", "time_base")
+AUDIO_PROBE_FIELDS = ("codec_name", "sample_rate", "channels")
+
+# ffprobe results keyed by (path, size, mtime), so combining the same clips again skips probing
+PROBE_CACHE = LRUCache(maxsize=4096)
+
+async def probe_clip(video_path):
+    """Return (video params, audio params or None) for a clip, or None if it cannot be probed"""
+    stat = os.stat(video_path)
+    key = (os.path.abspath(video_path), stat.st_size, stat.st_mtime_ns)
+    if key not in PROBE_CACHE:
+        result = await run_command([
+            "ffprobe", "-v", "error",
+            "-show_entries", f"stream=codec_type,{','.join(set(VIDEO_PROBE_FIELDS + AUDIO_PROBE_FIELDS))}",
+            "-of", "json",
+            str(video_path)
+        ], timeout=30)
+        if result.returncode != 0:
+            return None
+        streams = json.loads(result.stdout).get("streams", [])
+        video = next((stream for stream in streams if stream.get("codec_type") == "video"), None)
+        audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), None)
+        if video is None:
+            return None
+        PROBE_CACHE[key] = (
+            tuple(video.get(field) for field in VIDEO_PROBE_FIELDS),
+            tuple(audio.get(field) for field in AUDIO_PROBE_FIELDS) if audio else None
+        )
+    return PROBE_CACHE[key]
+
+# x264 profile names for the profiles ffprobe reports
+X264_PROFILES = {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high"}
+
+def build_normalize_command(video_path, output_path, target, has_audio):
+    """FFmpeg command re-encoding one clip to the stream parameters of the other clips"""
+    video, audio = target
+    params = dict(zip(VIDEO_PROBE_FIELDS, video))
+    cmd = ["ffmpeg", "-i", str(video_path)]
+    audio_args = ["-an"]
+    if audio:
+        sample_rate, channels = audio[1], audio[2]
+        if has_audio:
+            audio_args = ["-map", "0:a:0"]
+        else:
+            # Clips without sound get silence so every clip has the same streams
+            cmd += ["-f", "lavfi", "-i", f"anullsrc=r={sample_rate}:cl={'mono' if channels == 1 else 'stereo'}"]
+            audio_args = ["-map", "1:a:0", "-shortest"]
+        audio_args += ["-c:a", "aac", "-ar", str(sample_rate), "-ac", str(channels)]
+    sar = (params["sample_aspect_ratio"] or "1:1").replace(":", "/")
+    cmd += [
+        "-map", "0:v:0",
+        *audio_args,
+        "-vf", f"scale={params['width']}:{params['height']},setsar={sar},fps={params['r_frame_rate']},format={params['pix_fmt']}",
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-tune", "animation",
+        "-crf", "23",
+        *KEYFRAME_ARGS,
+        "-threads", str(FFMPEG_THREADS),
+        "-filter_threads", str(FFMPEG_THREADS),
+        "-x264-params", "sliced-threads=0:rc-lookahead=20"
+    ]
+    if params["profile"] in X264_PROFILES:
+        cmd += ["-profile:v", X264_PROFILES[params["profile"]]]
+    cmd += [
+        "-video_track_timescale", params["time_base"].split("/")[1],
+        "-movflags", "+faststart",
+        "-y",
+        str(output_path)
+    ]
+    return cmd
+
+async def normalize_clips(video_paths, work_dir, request_id):
+    """Re-encode only the clips whose stream parameters differ from the majority
+    
+    Returns the list of clips to concatenate, which is video_paths itself when
+    nothing was (or could be) normalized.
+    """
+    if not FFPROBE_AVAILABLE:
+        return video_paths
+    probes = await asyncio.gather(*(probe_clip(video_path) for video_path in video_paths))
+    if None in probes:
+        return video_paths
+    
+    # The most common parameters win; tuples are compared with their audio part too
+    target = max(set(probes), key=probes.count)
+    outliers = [i for i, probe in enumerate(probes) if probe != target]
+    if not outliers or target[0][0] != "h264" or len(outliers) == len(video_paths):
+        return video_paths
+    
+    print(f"🔧 Normalizing {len(outliers)} of {len(video_paths)} clips to match the others")
+    progress_tracker[request_id] = f"Normalizing {len(outliers)} clips..."
+    clip_paths = list(video_paths)
+    
+    async def normalize(i):
+        output_path = work_dir / f"normalized_{i}.mp4"
+        result = await run_ffmpeg(
+            build_normalize_command(video_paths[i], output_path, target, probes[i][1] is not None),
+            request_id=request_id,
+            label=f"Normalizing clip {i+1}..."
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr[-500:])
+        clip_paths[i] = str(output_path)
+    
+    try:
+        await asyncio.gather(*(normalize(i) for i in outliers))
+    except RuntimeError as e:
+        print(f"⚠️ Clip normalization failed, re-encoding everything instead: {e}")
+        return video_paths
+    return clip_paths
+
+async def needs_reencode(video_path):
+    """Whether a render must be re-encoded to play in browsers, i.e. is not H.264 in yuv420p"""
+    probe = await probe_clip(video_path) if FFPROBE_AVAILABLE else None
+    if probe is None:
+        # Manim writes H.264 MP4 unless asked for transparency, which gives a .mov
+        return Path(video_path).suffix.lower() != ".mp4"
+    params = dict(zip(VIDEO_PROBE_FIELDS, probe[0]))
+    return params["codec_name"] != "h264" or params["pix_fmt"] != "yuv420p"
+
+def build_hw_reencode_command(final_path):
+    """FFmpeg command re-encoding the piped concat list on the GPU selected by HWACCEL"""
+    if HWACCEL == "cuda":
+        # Decoded frames stay in GPU memory and go straight to the encoder
+        cmd = ["ffmpeg", "-hwaccel", "cuda", "-hwaccel_output_format", "cuda", *concat_input_args()]
+        if SCALE_CUDA_AVAILABLE:
+            # Normalize mixed pixel formats on the GPU too
+            cmd += ["-vf", "scale_cuda=format=yuv420p"]
+        cmd += [
+            "-c:v", "h264_nvenc",
+            "-preset", "p4",
+            "-rc", "vbr",
+            "-cq", "23",
+            *KEYFRAME_ARGS
+        ]
+    else:
         cmd = [
             "ffmpeg",
-            "-f", "concat",
-            "-safe", "0",
-            "-i", str(concat_file),
-            "-c", "copy",  # Copy streams without re-encoding for speed
+            "-hwaccel", "vaapi",
+            "-hwaccel_device", VAAPI_DEVICE,
+            "-hwaccel_output_format", "vaapi",
+            *concat_input_args(),
+            "-vf", "scale_vaapi=format=nv12",
+            "-c:v", "h264_vaapi",
+            "-qp", "23",
+            *KEYFRAME_ARGS
+        ]
+    return cmd + [
+        "-c:a", "aac",
+        "-movflags", "+faststart",  # Streamable output
+        "-y",
+        str(final_path)
+    ]
+
+def build_concat_list(video_paths):
+    """Concat demuxer list for the given files, to be piped to FFmpeg's stdin"""
+    # Entries need absolute file: URLs because relative ones would resolve against "pipe:"
+    return "".join(
+        "file 'file:{}'\n".format(str(Path(video_path).resolve()).replace("'", "'\\''"))
+        for video_path in video_paths
+    ).encode("utf-8")
+
+async def remux_to_ts(video_paths, work_dir, request_id):
+    """Remux every clip to MPEG-TS in parallel, or return None if any clip cannot be"""
+    progress_tracker[request_id] = "Remuxing clips to MPEG-TS..."
+    ts_paths = [work_dir / f"clip_{i}.ts" for i in range(len(video_paths))]
+    results = await asyncio.gather(*(
+        run_ffmpeg([
+            "ffmpeg",
+            "-i", str(video_path),
+            "-c", "copy",
+            "-bsf:v", "h264_mp4toannexb",  # TS carries H.264 in Annex B form
+            "-f", "mpegts",
+            "-y",
+            str(ts_path)
+        ])
+        for video_path, ts_path in zip(video_paths, ts_paths)
+    ))
+    failed = next((result for result in results if result.returncode != 0), None)
+    if failed is not None:
+        print(f"⚠️ MPEG-TS remux failed, concatenating the MP4 files directly: {failed.stderr[-500:]}")
+        return None
+    return ts_paths
+
+def build_copy_concat_command(final_path, from_ts=False):
+    """FFmpeg command joining the piped concat list by stream copy"""
+    cmd = [
+        "ffmpeg",
+        "-fflags", "+genpts",
+        *concat_input_args(),
+        "-c", "copy",  # Copy streams without re-encoding for speed
+    ]
+    if from_ts:
+        cmd += ["-bsf:a", "aac_adtstoasc"]  # ADTS AAC from the TS back to MP4 form
+    return cmd + [
+        "-avoid_negative_ts", "make_zero",
+        "-movflags", "+faststart",  # Streamable output
+        "-y",  # Overwrite output file
+        str(final_path)  # Use absolute path
+    ]
+
+async def concat_with_ffmpeg(video_paths, final_path, request_id, work_dir):
+    """Concatenate videos with the FFmpeg concat demuxer, re-encoding if stream copy fails"""
+    progress_tracker[request_id] = "Creating FFmpeg concat list..."
+    concat_list = build_concat_list(video_paths)
+    
+    # Joining MPEG-TS segments is linear in their size, while the MP4 demuxer
+    # re-parses every moov atom
+    ts_paths = await remux_to_ts(video_paths, work_dir, request_id)
+    
+    progress_tracker[request_id] = "Combining videos with FFmpeg..."
+    
+    # First try with copy (fastest), if it fails, fallback to re-encoding
+    if ts_paths is not None:
+        cmd = build_copy_concat_command(final_path, from_ts=True)
+        print(f"🚀 Running FFmpeg command: {' '.join(cmd)}")
+        result = await run_ffmpeg(cmd, request_id=request_id, label="Combining videos with FFmpeg...", input=build_concat_list(ts_paths))
+        if result.returncode != 0:
+            print(f"⚠️ MPEG-TS concat failed, concatenating the MP4 files directly: {result.stderr[-500:]}")
+    
+    if ts_paths is None or result.returncode != 0:
+        cmd = build_copy_concat_command(final_path)
+        print(f"🚀 Running FFmpeg command: {' '.join(cmd)}")
+        result = await run_ffmpeg(cmd, request_id=request_id, label="Combining videos with FFmpeg...", input=concat_list)
+    
+    # If copy mode fails, try with re-encoding (on the GPU when one is available)
+    if result.returncode != 0 and REENCODE_FALLBACK and HWACCEL != "none":
+        print(f"⚠️ Copy mode failed, trying with {HWACCEL} re-encoding...")
+        cmd_hw = build_hw_reencode_command(final_path)
+
+        print(f"🔄 Running FFmpeg with GPU re-encoding: {' '.join(cmd_hw)}")
+
+        result = await run_ffmpeg(cmd_hw, request_id=request_id, label="Re-encoding videos on the GPU...", input=concat_list)
+
+        if result.returncode != 0:
+            print(f"⚠️ GPU re-encoding failed, falling back to libx264: {result.stderr[-500:]}")
+
+    if result.returncode != 0 and REENCODE_FALLBACK:
+        print("⚠️ Copy mode failed, trying with re-encoding...")
+        cmd_reencode = [
+            "ffmpeg",
+            *concat_input_args(),
+            "-c:v", "libx264",        # Re-encode video
+            "-preset", "veryfast",    # ~2x faster than "fast" at similar quality
+            "-tune", "animation",     # Flat colours and sharp edges of Manim scenes
+            "-crf", "23",             # Good quality
+            *KEYFRAME_ARGS,
+            "-maxrate", "8M",
+            "-bufsize", "16M",
+            "-pix_fmt", "yuv420p",
+            "-threads", str(FFMPEG_THREADS),
+            "-filter_threads", str(FFMPEG_THREADS),  # Scaling and pixel format conversion
+            "-x264-params", "sliced-threads=0:rc-lookahead=20",  # Frame threads, shorter lookahead
+            "-c:a", "aac",            # Re-encode audio
+            "-b:a", "128k",
+            "-movflags", "+faststart",  # Streamable output
             "-y",  # Overwrite output file
-            str(final_path)  # Use absolute path
+            str(final_path)
         ]
         
-        print(f"🚀 Running FFmpeg command: {' '.join(cmd)}")
+        print(f"🔄 Running FFmpeg with re-encoding: {' '.join(cmd_reencode)}")
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            cwd=temp_dir,
-            timeout=300  # 5 minute timeout
+        result = await run_ffmpeg(cmd_reencode, request_id=request_id, label="Re-encoding videos...", input=concat_list)
+    
+    return result
+
+async def combine_into_output(video_paths, request_id, fingerprints=None):
+    """Concatenate existing clips into a combined video in OUTPUT_DIR"""
+    # The same clips in the same order always combine to the same file
+    if fingerprints is None:
+        fingerprints = [file_fingerprint(video_path) for video_path in video_paths]
+    combine_key = cache_key(*fingerprints)
+    final_filename = f"combined_video_{combine_key}.mp4"
+    final_path = OUTPUT_DIR / final_filename
+    video_url = f"http://localhost:3001/videos/{final_filename}"
+    
+    if cache_hit(final_path):
+        print(f"♻️ Reusing previously combined video: {final_path}")
+        progress_tracker[request_id] = "Completed successfully"
+        return ManimResponse(
+            success=True,
+            videoPath=str(final_path),
+            videoUrl=video_url
         )
-        
-        # If copy mode fails, try with re-encoding
-        if result.returncode != 0:
-            print("⚠️ Copy mode failed, trying with re-encoding...")
-            cmd_reencode = [
-                "ffmpeg",
-                "-f", "concat",
-                "-safe", "0",
-                "-i", str(concat_file),
-                "-c:v", "libx264",  # Re-encode video
-                "-c:a", "aac",      # Re-encode audio
-                "-preset", "fast",   # Fast encoding
-                "-crf", "23",        # Good quality
-                "-y",  # Overwrite output file
-                str(final_path)
-            ]
-            
-            print(f"🔄 Running FFmpeg with re-encoding: {' '.join(cmd_reencode)}")
+    
+    # Build the video under a hidden name next to final_path and rename it into
+    # place once complete (the suffix keeps concurrent identical requests apart)
+    combined_path = OUTPUT_DIR / f".{uuid.uuid4().hex[:8]}.{final_filename}"
+    
+    progress_tracker[request_id] = "Combining videos..."
+    
+    try:
+        # Clips with identical codec parameters (everything generate_video produces)
+        # are joined in-process by merging their MP4 sample tables
+        try:
+            await asyncio.to_thread(concat_mp4, video_paths, combined_path)
+            print(f"⚡ Videos concatenated in-process")
+        except Mp4ConcatError as e:
+            print(f"⚠️ In-process concatenation not possible ({e}), falling back to FFmpeg...")
+            # Re-encode just the mismatched clips so the rest can still be stream copied
+            work_dir = new_work_dir()
+            try:
+                clip_paths = await normalize_clips(video_paths, work_dir, request_id)
+                result = None
+                if clip_paths is not video_paths:
+                    try:
+                        await asyncio.to_thread(concat_mp4, clip_paths, combined_path)
+                        print(f"⚡ Normalized videos concatenated in-process")
+                    except Mp4ConcatError:
+                        # Encoder headers still differ; FFmpeg can copy-concat the normalized clips
+                        combined_path.unlink(missing_ok=True)
+                if not combined_path.exists():
+                    result = await concat_with_ffmpeg(clip_paths, combined_path, request_id, work_dir)
+            finally:
+                remove_work_dir(work_dir)
             
-            result = subprocess.run(
-                cmd_reencode,
-                capture_output=True,
-                text=True,
-                cwd=temp_dir,
-                timeout=300  # 5 minute timeout
-            )
-        
-        if result.returncode != 0:
-            error_msg = f"Video combination failed:\nSTDOUT: {result.stdout}\nSTDERR: {result.stderr}"
-            print(f"❌ {error_msg}")
-            return ManimResponse(
-                success=False,
-                error=error_msg
-            )
+            if result is not None and result.returncode != 0:
+                error_msg = f"Video combination failed:\nSTDOUT: {result.stdout}\nSTDERR: {result.stderr}"
+                print(f"❌ {error_msg}")
+                return ManimResponse(
+                    success=False,
+                    error=error_msg
+                )
         
         # Verify the combined video was created
-        if not final_path.exists():
+        if not combined_path.exists():
             return ManimResponse(
                 success=False,
                 error="Combined video file was not created"
             )
         
-        print(f"✅ Videos combined successfully: {final_path}")
-        
-        # Generate URL for accessing the video
-        video_url = f"http://localhost:3001/videos/{final_filename}"
-        
-        print(f"🎬 Combined video saved to: {final_path}")
-        print(f"🔗 Combined video URL: {video_url}")
+        os.replace(combined_path, final_path)
+    finally:
+        combined_path.unlink(missing_ok=True)
+    
+    print(f"✅ Videos combined successfully: {final_path}")
+    
+    print(f"🎬 Combined video saved to: {final_path}")
+    print(f"🔗 Combined video URL: {video_url}")
+    
+    return ManimResponse(
+        success=True,
+        videoPath=str(final_path),
+        videoUrl=video_url
+    )
+
+@app.post("/combine-videos", response_model=ManimResponse)
+async def combine_videos(request: CombineVideosRequest):
+    """Combine multiple video files into one final video"""
+    print(f"🎬 Received video combination request")
+    print(f"📝 Number of videos to combine: {len(request.videoPaths)}")
+    
+    # Generate unique identifier for this request
+    request_id = request.messageId or str(uuid.uuid4())
+    
+    # Track progress
+    progress_tracker[request_id] = "Preparing video combination..."
+    
+    try:
+        progress_tracker[request_id] = "Verifying input videos..."
+        # Verify all input videos exist, keeping the stat results for the cache key;
+        # a clip repeated in the list is only looked up once
+        fingerprints = []
+        known = {}
+        for i, video_path in enumerate(request.videoPaths):
+            try:
+                if video_path not in known:
+                    known[video_path] = file_fingerprint(video_path)
+                fingerprints.append(known[video_path])
+            except OSError:
+                progress_tracker[request_id] = f"Failed: Video {i+1} not found"
+                return ManimResponse(
+                    success=False,
+                    error=f"Video file not found: {video_path}"
+                )
         
-        return ManimResponse(
-            success=True,
-            videoPath=str(final_path),
-            videoUrl=video_url
-        )
+        return await combine_into_output(request.videoPaths, request_id, fingerprints)
         
     except subprocess.TimeoutExpired:
         return ManimResponse(
@@ -208,27 +1236,29 @@ async def combine_videos(request: CombineVideosRequest):
             success=False,
             error=error_msg
         )
-    finally:
-        # Clean up temporary directory
-        try:
-            shutil.rmtree(temp_dir)
-        except Exception as e:
-            print(f"⚠️ Failed to clean up temp directory: {e}")
 
 @app.post("/generate-video", response_model=ManimResponse)
 async def generate_video(request: ManimRequest):
     """Generate video from Manim code"""
     print(f"📹 Received video generation request")
-    print(f"🔧 Manim Code:\n{request.manimCode}")
+    logger.debug("🔧 Manim Code:\n%s", request.manimCode)
     
     # Generate unique identifier for this request
     request_id = request.messageId or str(uuid.uuid4())
     
+    quality = QUALITY_NAMES.get(request.quality, request.quality)
+    if quality not in QUALITY_DIRS:
+        return ManimResponse(
+            success=False,
+            error=f"Invalid quality '{request.quality}', expected one of: {', '.join([*QUALITY_DIRS, *QUALITY_NAMES])}"
+        )
+    resolution = QUALITY_DIRS[quality]
+    
     # Track progress
     progress_tracker[request_id] = "Starting video generation..."
     
     # Create temporary directory for this generation
-    temp_dir = Path(tempfile.mkdtemp(prefix=f"manim_{request_id}_"))
+    temp_dir = new_work_dir()
     
     try:
         progress_tracker[request_id] = "Writing Manim script..."
@@ -236,68 +1266,77 @@ async def generate_video(request: ManimRequest):
         script_file = temp_dir / "scene.py"
         
         # Ensure the code has proper structure and imports
-        manim_code = request.manimCode.strip()
-        
-        # Always add required imports at the beginning (avoid duplicates)
-        required_imports = [
-            "from manim import *",
-            "from math import *", 
-            "import random",
-            "import numpy as np"
-        ]
+        manim_code = normalize_manim_code(request.manimCode)
+        
+        # Reject code that cannot render before starting Manim
+        validation_error = validate_scene_code(manim_code, source=request.manimCode)
+        if validation_error:
+            progress_tracker[request_id] = "Failed: Invalid Manim code"
+            print(f"❌ {validation_error}")
+            return ManimResponse(
+                success=False,
+                error=validation_error
+            )
+        
+        narration_path = None
+        if request.narrationAudio:
+            narration_path = Path(request.narrationAudio)
+            if not narration_path.exists():
+                print(f"⚠️ Narration audio file not found: {request.narrationAudio}")
+                narration_path = None
         
-        # Remove any existing import lines to avoid conflicts
-        code_lines = manim_code.split('\n')
-        filtered_lines = []
-        for line in code_lines:
-            line_stripped = line.strip()
-            if not (line_stripped.startswith('from manim import') or 
-                   line_stripped.startswith('from math import') or
-                   line_stripped.startswith('import random') or
-                   line_stripped.startswith('import numpy')):
-                filtered_lines.append(line)
+        # The same code, quality and narration always render to the same file
+        render_key = cache_key(
+            manim_code,
+            quality,
+            file_fingerprint(narration_path) if narration_path else ""
+        )
+        final_filename = f"video_{render_key}.mp4"
+        final_path = OUTPUT_DIR / final_filename
+        video_url = f"http://localhost:3001/videos/{final_filename}"
         
-        # Combine imports with cleaned code
-        manim_code = '\n'.join(required_imports) + '\n\n' + '\n'.join(filtered_lines)
+        if cache_hit(final_path):
+            print(f"♻️ Reusing previously rendered video: {final_path}")
+            progress_tracker[request_id] = "Completed successfully"
+            return ManimResponse(
+                success=True,
+                videoPath=str(final_path),
+                videoUrl=video_url,
+                resolution=resolution
+            )
         
         # Write the code to file
-        with open(script_file, 'w', encoding='utf-8') as f:
-            f.write(manim_code)
+        write_file(script_file, manim_code.encode("utf-8"))
         
         print(f"📄 Script written to: {script_file}")
-        print(f"🔍 First 10 lines of generated script:")
-        lines = manim_code.split('\n')
-        for i, line in enumerate(lines[:10]):
-            print(f"   {i+1}: {line}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔍 First 10 lines of generated script:")
+            for i, line in enumerate(manim_code.split('\n')[:10]):
+                logger.debug("   %d: %s", i + 1, line)
         
         progress_tracker[request_id] = "Rendering video with Manim..."
         
-        # Run Manim to generate the video
-        output_file = temp_dir / "media" / "videos" / "scene" / "1080p60" / "GenScene.mp4"
-        
-        # Execute Manim command
-        cmd = [
-            sys.executable, "-m", "manim",
-            str(script_file),
-            "GenScene",
-            "-qh",  # High quality
-            "--output_file", f"GenScene_{request_id}",
-            "--media_dir", str(temp_dir / "media")
-        ]
-        
-        print(f"🚀 Running command: {' '.join(cmd)}")
+        def on_render_progress(animations):
+            progress_tracker[request_id] = {
+                "progress": f"Rendering video with Manim... ({animations} animations rendered)",
+                "phase": "rendering",
+                "animations": animations
+            }
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            cwd=temp_dir,
-            timeout=300  # 5 minute timeout
-        )
+        async with render_process() as renderer:
+            print(f"🚀 Rendering GenScene in render process (quality: {quality})")
+            
+            reply = await renderer.render({
+                "script": str(script_file),
+                "scene": "GenScene",
+                "output_file": f"GenScene_{request_id}",
+                "quality": quality,
+                "cwd": str(temp_dir)
+            }, on_progress=on_render_progress)
         
-        if result.returncode != 0:
+        if not reply["success"]:
             progress_tracker[request_id] = "Failed: Manim rendering error"
-            error_msg = f"Manim generation failed:\nSTDOUT: {result.stdout}\nSTDERR: {result.stderr}"
+            error_msg = f"Manim generation failed:\n{reply['error']}"
             print(f"❌ {error_msg}")
             return ManimResponse(
                 success=False,
@@ -306,70 +1345,26 @@ async def generate_video(request: ManimRequest):
         
         progress_tracker[request_id] = "Saving video file..."
         
-        # Find the generated video file
-        video_files = list(temp_dir.rglob("*.mp4"))
-        if not video_files:
+        # Move the generated video out of the cache directory
+        rendered_video = Path(reply["video"])
+        if not rendered_video.exists():
             progress_tracker[request_id] = "Failed: No video file generated"
             return ManimResponse(
                 success=False,
                 error="No video file was generated"
             )
         
-        generated_video = video_files[0]
+        generated_video = Path(await asyncio.to_thread(shutil.move, rendered_video, temp_dir / rendered_video.name))
         print(f"✅ Video generated: {generated_video}")
         
-        # Handle narration audio embedding if provided
-        final_filename = f"video_{request_id}.mp4"
-        final_path = OUTPUT_DIR / final_filename
-        
-        if request.narrationAudio and FFMPEG_AVAILABLE:
-            print(f"🎵 Embedding narration audio: {request.narrationAudio}")
-            progress_tracker[request_id] = "Embedding narration audio..."
-            
-            # Copy narration audio to temp directory for processing
-            narration_path = Path(request.narrationAudio)
-            if narration_path.exists():
-                temp_audio = temp_dir / "narration.mp3"
-                shutil.copy2(narration_path, temp_audio)
-                
-                # Use FFmpeg to combine video with narration audio
-                cmd_audio = [
-                    "ffmpeg", "-y",
-                    "-i", str(generated_video),  # Video input
-                    "-i", str(temp_audio),       # Audio input
-                    "-c:v", "copy",              # Copy video stream
-                    "-c:a", "aac",               # Encode audio as AAC
-                    "-map", "0:v:0",             # Map video from first input
-                    "-map", "1:a:0",             # Map audio from second input
-                    "-shortest",                 # End when shortest stream ends
-                    str(final_path)
-                ]
-                
-                print(f"🔄 Embedding audio: {' '.join(cmd_audio)}")
-                
-                audio_result = subprocess.run(
-                    cmd_audio,
-                    capture_output=True,
-                    text=True,
-                    timeout=60  # 1 minute timeout for audio embedding
-                )
-                
-                if audio_result.returncode != 0:
-                    print(f"⚠️ Audio embedding failed: {audio_result.stderr}")
-                    # Fall back to video without audio
-                    shutil.copy2(generated_video, final_path)
-                else:
-                    print(f"✅ Successfully embedded narration audio")
-            else:
-                print(f"⚠️ Narration audio file not found: {request.narrationAudio}")
-                # Fall back to video without audio
-                shutil.copy2(generated_video, final_path)
-        else:
-            # No audio to embed or FFmpeg not available
-            shutil.copy2(generated_video, final_path)
-        
-        # Generate URL for accessing the video
-        video_url = f"http://localhost:3001/videos/{final_filename}"
+        final_path = await finalize_video(generated_video, final_path, temp_dir, request_id, narration_path)
+        if final_path is None:
+            progress_tracker[request_id] = "Failed: Video conversion error"
+            return ManimResponse(
+                success=False,
+                error="The rendered video could not be converted to H.264"
+            )
+        video_url = f"http://localhost:3001/videos/{final_path.name}"
         
         print(f"🎬 Video saved to: {final_path}")
         print(f"🔗 Video URL: {video_url}")
@@ -379,7 +1374,8 @@ async def generate_video(request: ManimRequest):
         return ManimResponse(
             success=True,
             videoPath=str(final_path),
-            videoUrl=video_url
+            videoUrl=video_url,
+            resolution=resolution
         )
         
     except subprocess.TimeoutExpired:
@@ -396,15 +1392,171 @@ async def generate_video(request: ManimRequest):
         )
     finally:
         # Clean up temporary directory
-        try:
-            shutil.rmtree(temp_dir)
-        except Exception as e:
-            print(f"⚠️ Failed to clean up temp directory: {e}")
+        remove_work_dir(temp_dir)
+
+@app.post("/generate-video-preview", response_model=ManimResponse)
+async def generate_video_preview(request: ManimRequest):
+    """Generate a quick low-quality (480p15) video, whatever quality the request asks for"""
+    return await generate_video(request.model_copy(update={"quality": "l"}))
+
+@app.post("/generate-videos-batch", response_model=ManimResponse)
+async def generate_videos_batch(request: BatchManimRequest):
+    """Generate several videos in one render process, optionally combining them"""
+    print(f"📹 Received batch video generation request")
+    print(f"📝 Number of scenes to render: {len(request.scenes)}")
+    
+    # Generate unique identifier for this request
+    request_id = request.messageId or str(uuid.uuid4())
+    
+    if not request.scenes:
+        return ManimResponse(
+            success=False,
+            error="No scenes to render"
+        )
+    quality = QUALITY_NAMES.get(request.quality, request.quality)
+    if quality not in QUALITY_DIRS:
+        return ManimResponse(
+            success=False,
+            error=f"Invalid quality '{request.quality}', expected one of: {', '.join([*QUALITY_DIRS, *QUALITY_NAMES])}"
+        )
+    resolution = QUALITY_DIRS[quality]
+    
+    # Track progress
+    progress_tracker[request_id] = "Starting batch video generation..."
+    
+    temp_dir = new_work_dir()
+    
+    try:
+        progress_tracker[request_id] = "Validating Manim scripts..."
+        # Validate every scene before rendering any of them
+        final_paths = []
+        pending = {}  # final path -> (scene index, code, scene class) for scenes not rendered before
+        for i, scene_code in enumerate(request.scenes):
+            manim_code = normalize_manim_code(scene_code)
+            # Slides may name their scene classes freely; the code still decides the class
+            scene_name = scene_class_name(manim_code)
+            validation_error = validate_scene_code(manim_code, scene_name, source=scene_code)
+            if validation_error:
+                progress_tracker[request_id] = f"Failed: Invalid Manim code in scene {i+1}"
+                print(f"❌ Scene {i+1}: {validation_error}")
+                return ManimResponse(
+                    success=False,
+                    error=f"Scene {i+1}: {validation_error}"
+                )
+            
+            # Same key as generate_video, so clips are shared between both endpoints
+            final_path = OUTPUT_DIR / f"video_{cache_key(manim_code, quality, '')}.mp4"
+            final_paths.append(final_path)
+            if not cache_hit(final_path) and final_path not in pending:
+                pending[final_path] = (i, manim_code, scene_name)
+        
+        print(f"♻️ Reusing {len(final_paths) - len(pending)} of {len(final_paths)} videos")
+        
+        # Render all remaining scenes back to back in a single render process
+        rendered = {}
+        if pending:
+            async with render_process() as renderer:
+                for n, (final_path, (i, manim_code, scene_name)) in enumerate(pending.items()):
+                    scene_progress = f"Rendering scene {n+1} of {len(pending)} with Manim..."
+                    progress_tracker[request_id] = scene_progress
+                    
+                    def on_render_progress(animations, scene_progress=scene_progress, scene=n+1):
+                        progress_tracker[request_id] = {
+                            "progress": f"{scene_progress} ({animations} animations rendered)",
+                            "phase": "rendering",
+                            "animations": animations,
+                            "scene": scene,
+                            "scenes": len(pending)
+                        }
+                    
+                    script_file = temp_dir / f"scene_{i}.py"
+                    write_file(script_file, manim_code.encode("utf-8"))
+                    
+                    reply = await renderer.render({
+                        "script": str(script_file),
+                        "scene": scene_name,
+                        "output_file": f"{scene_name}_{request_id}_{i}",
+                        "quality": quality,
+                        "cwd": str(temp_dir)
+                    }, on_progress=on_render_progress)
+                    
+                    if not reply["success"]:
+                        progress_tracker[request_id] = f"Failed: Manim rendering error in scene {i+1}"
+                        error_msg = f"Manim generation failed for scene {i+1}:\n{reply['error']}"
+                        print(f"❌ {error_msg}")
+                        return ManimResponse(
+                            success=False,
+                            error=error_msg
+                        )
+                    
+                    rendered_video = Path(reply["video"])
+                    if not rendered_video.exists():
+                        progress_tracker[request_id] = "Failed: No video file generated"
+                        return ManimResponse(
+                            success=False,
+                            error=f"No video file was generated for scene {i+1}"
+                        )
+                    rendered[final_path] = Path(await asyncio.to_thread(shutil.move, rendered_video, temp_dir / rendered_video.name))
+                    print(f"✅ Scene {i+1} rendered: {rendered[final_path]}")
+        
+        # Finalize outside the render process so the next request can start rendering
+        progress_tracker[request_id] = "Saving video files..."
+        published = dict(zip(rendered, await asyncio.gather(*(
+            finalize_video(generated_video, final_path, temp_dir, request_id)
+            for final_path, generated_video in rendered.items()
+        ))))
+        if None in published.values():
+            progress_tracker[request_id] = "Failed: Video conversion error"
+            return ManimResponse(
+                success=False,
+                error="A rendered video could not be converted to H.264"
+            )
+        final_paths = [published.get(final_path, final_path) for final_path in final_paths]
+        
+        video_paths = [str(final_path) for final_path in final_paths]
+        video_urls = [f"http://localhost:3001/videos/{final_path.name}" for final_path in final_paths]
+        
+        if request.combine:
+            progress_tracker[request_id] = "Combining videos..."
+            response = await combine_into_output(video_paths, request_id)
+        else:
+            response = ManimResponse(success=True)
+        
+        response.videoPaths = video_paths
+        response.videoUrls = video_urls
+        response.resolution = resolution
+        
+        if response.success:
+            progress_tracker[request_id] = "Completed successfully"
+        return response
+        
+    except subprocess.TimeoutExpired:
+        return ManimResponse(
+            success=False,
+            error="Video generation timed out (5 minutes per scene)"
+        )
+    except Exception as e:
+        error_msg = f"Unexpected error during batch video generation: {str(e)}"
+        print(f"❌ {error_msg}")
+        return ManimResponse(
+            success=False,
+            error=error_msg
+        )
+    finally:
+        # Clean up temporary directory
+        remove_work_dir(temp_dir)
 
 if __name__ == "__main__":
     print("🚀 Starting 3D Avatar Manim Worker...")
     print(f"📁 Output directory: {OUTPUT_DIR.absolute()}")
+    print(f"📁 Scratch directory: {WORK_ROOT.parent.absolute()}")
     print(f"🎬 FFmpeg available: {FFMPEG_AVAILABLE}")
+    print(f"⚡ NVENC available: {NVENC_AVAILABLE}")
+    print(f"⚡ VAAPI available: {VAAPI_AVAILABLE}")
+    print(f"🖥️ Re-encoding on: {HWACCEL}")
+    print(f"📐 LaTeX available: {LATEX_AVAILABLE}")
+    print(f"🧮 MathJax enabled: {MATHJAX_AVAILABLE}")
+    print(f"🧵 Render processes: {MANIM_CONCURRENCY}")
     
     uvicorn.run(
         app,
@@ -0,0 +1,34 @@
+// Long-lived TeX to SVG converter for the Manim render processes.
+// Reads one JSON request per line on stdin ({"tex": "..."}) and answers each
+// with one JSON line on stdout ({"svg": "..."} or {"error": "..."}).
+const readline = require('readline');
+const { mathjax } = require('mathjax-full/js/mathjax.js');
+const { TeX } = require('mathjax-full/js/input/tex.js');
+const { SVG } = require('mathjax-full/js/output/svg.js');
+const { liteAdaptor } = require('mathjax-full/js/adaptors/liteAdaptor.js');
+const { RegisterHTMLHandler } = require('mathjax-full/js/handlers/html.js');
+const { AllPackages } = require('mathjax-full/js/input/tex/AllPackages.js');
+
+const adaptor = liteAdaptor();
+RegisterHTMLHandler(adaptor);
+
+const document = mathjax.document('', {
+  InputJax: new TeX({ packages: AllPackages }),
+  // Inline every glyph path instead of <use> references
+  OutputJax: new SVG({ fontCache: 'none' }),
+});
+
+const lines = readline.createInterface({ input: process.stdin });
+
+lines.on('line', (line) => {
+  let reply;
+  try {
+    const { tex } = JSON.parse(line);
+    const svg = adaptor.innerHTML(document.convert(tex, { display: true }));
+    // MathJax renders unknown macros as red error text instead of throwing
+    reply = svg.includes('data-mjx-error') ? { error: 'MathJax could not typeset the expression' } : { svg };
+  } catch (err) {
+    reply = { error: String(err.message || err) };
+  }
+  process.stdout.write(JSON.stringify(reply) + '\n');
+});
@@ -0,0 +1,491 @@
+"""
+In-process MP4 concatenation for clips that share codec parameters.
+
+Concatenates progressive (non-fragmented) MP4 files by appending their
+media data and merging the per-track sample tables, without decoding or
+spawning FFmpeg. Inputs that cannot be joined this way raise Mp4ConcatError
+so the caller can fall back to the FFmpeg concat demuxer.
+"""
+import struct
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class Mp4ConcatError(Exception):
+    """Raised when the inputs cannot be concatenated in-process"""
+
+
+def _box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def _full_box(box_type, version, flags, payload):
+    return _box(box_type, struct.pack(">I", (version << 24) | flags) + payload)
+
+
+def _iter_boxes(data, start=0, end=None):
+    """Yield (type, start, header_size, size) for the boxes in data[start:end]"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos < end:
+        if end - pos < 8:
+            raise Mp4ConcatError("Truncated box header")
+        size, box_type = struct.unpack_from(">I4s", data, pos)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_size or pos + size > end:
+            raise Mp4ConcatError(f"Invalid size for box {box_type!r}")
+        yield box_type, pos, header_size, size
+        pos += size
+
+
+def _children(data, start, header_size, size):
+    return [
+        (box_type, data[box_start:box_start + box_size], box_header)
+        for box_type, box_start, box_header, box_size
+        in _iter_boxes(data, start + header_size, start + size)
+    ]
+
+
+def _child_map(children):
+    mapped = {}
+    for box_type, raw, header_size in children:
+        mapped.setdefault(box_type, (raw, header_size))
+    return mapped
+
+
+def _read_top_level(path):
+    """Return the top-level boxes of path, reading only the small ones into memory"""
+    boxes = {}
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        file_size = f.tell()
+        pos = 0
+        while pos < file_size:
+            f.seek(pos)
+            header = f.read(16)
+            if len(header) < 8:
+                raise Mp4ConcatError(f"Truncated box header in {path}")
+            size, box_type = struct.unpack_from(">I4s", header)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack_from(">Q", header, 8)[0]
+                header_size = 16
+            elif size == 0:
+                size = file_size - pos
+            if size < header_size or pos + size > file_size:
+                raise Mp4ConcatError(f"Invalid size for box {box_type!r} in {path}")
+            if box_type in (b"moof", b"mfra"):
+                raise Mp4ConcatError(f"Fragmented MP4 is not supported: {path}")
+            if box_type == b"mdat" and b"mdat" in boxes:
+                raise Mp4ConcatError(f"Multiple mdat boxes are not supported: {path}")
+            if box_type in (b"ftyp", b"moov"):
+                f.seek(pos)
+                boxes[box_type] = f.read(size)
+            elif box_type == b"mdat":
+                boxes[box_type] = (pos + header_size, size - header_size)
+            pos += size
+    for box_type in (b"ftyp", b"moov", b"mdat"):
+        if box_type not in boxes:
+            raise Mp4ConcatError(f"Missing {box_type.decode()} box in {path}")
+    return boxes
+
+
+def _duration_field(raw, header_size, v0_offset, v1_offset):
+    """Return (offset, format) of the duration field of a mvhd/tkhd/mdhd box"""
+    version = raw[header_size]
+    if version == 1:
+        return header_size + v1_offset, ">Q"
+    return header_size + v0_offset, ">I"
+
+
+def _with_duration(raw, header_size, v0_offset, v1_offset, duration):
+    offset, fmt = _duration_field(raw, header_size, v0_offset, v1_offset)
+    if fmt == ">I" and duration > 0xFFFFFFFF:
+        raise Mp4ConcatError("Combined duration does not fit a version 0 box")
+    patched = bytearray(raw)
+    struct.pack_into(fmt, patched, offset, duration)
+    return bytes(patched)
+
+
+def _read_duration(raw, header_size, v0_offset, v1_offset):
+    offset, fmt = _duration_field(raw, header_size, v0_offset, v1_offset)
+    return struct.unpack_from(fmt, raw, offset)[0]
+
+
+def _read_timescale(raw, header_size):
+    """Return the timescale of a mvhd/mdhd box"""
+    offset = header_size + (20 if raw[header_size] == 1 else 12)
+    return struct.unpack_from(">I", raw, offset)[0]
+
+
+def _table(raw, header_size, entry_format):
+    """Decode a full box holding an entry count followed by fixed-size entries"""
+    count = struct.unpack_from(">I", raw, header_size + 4)[0]
+    entry_size = struct.calcsize(entry_format)
+    base = header_size + 8
+    if base + count * entry_size > len(raw):
+        raise Mp4ConcatError("Truncated sample table")
+    return [struct.unpack_from(entry_format, raw, base + i * entry_size) for i in range(count)]
+
+
+# Bytes between a sample entry header and its child boxes, per handler type
+SAMPLE_ENTRY_FIELDS = {b"vide": 78, b"soun": 28}
+
+
+def _skip_descriptor_length(data, pos):
+    for _ in range(4):
+        pos += 1
+        if not data[pos - 1] & 0x80:
+            break
+    return pos
+
+
+def _without_esds_bitrates(raw):
+    """Zero the informational bitrate fields of an esds box"""
+    data = bytearray(raw)
+    try:
+        pos = 12
+        if data[pos] != 0x03:
+            return raw
+        pos = _skip_descriptor_length(data, pos + 1)
+        es_flags = data[pos + 2]
+        pos += 3
+        if es_flags & 0x80:
+            pos += 2
+        if es_flags & 0x40:
+            pos += 1 + data[pos]
+        if es_flags & 0x20:
+            pos += 2
+        if data[pos] != 0x04:
+            return raw
+        pos = _skip_descriptor_length(data, pos + 1)
+        data[pos + 5:pos + 13] = bytes(8)
+    except IndexError:
+        return raw
+    return bytes(data)
+
+
+def _codec_signature(stsd_raw, stsd_header, handler):
+    """Return the sample description with per-clip bitrate metadata removed"""
+    entries = list(_iter_boxes(stsd_raw, stsd_header + 8))
+    entry_type, entry_start, entry_header, entry_size = entries[0]
+    fields = SAMPLE_ENTRY_FIELDS.get(handler)
+    if fields is None:
+        return stsd_raw
+    if handler == b"soun":
+        # QuickTime sound sample descriptions version 1/2 carry extra fields
+        version = struct.unpack_from(">H", stsd_raw, entry_start + entry_header + 8)[0]
+        fields += {1: 16, 2: 36}.get(version, 0)
+    children_start = entry_start + entry_header + fields
+    signature = [entry_type, stsd_raw[entry_start + entry_header:children_start]]
+    for box_type, start, _, size in _iter_boxes(stsd_raw, children_start, entry_start + entry_size):
+        if box_type == b"btrt":
+            continue
+        child = stsd_raw[start:start + size]
+        signature.append(_without_esds_bitrates(child) if box_type == b"esds" else child)
+    return b"".join(signature)
+
+
+def _parse_track(raw, header_size):
+    trak = _children(raw, 0, header_size, len(raw))
+    trak_map = _child_map(trak)
+    if b"tkhd" not in trak_map or b"mdia" not in trak_map:
+        raise Mp4ConcatError("Track without tkhd/mdia")
+
+    mdia_raw, mdia_header = trak_map[b"mdia"]
+    mdia = _children(mdia_raw, 0, mdia_header, len(mdia_raw))
+    mdia_map = _child_map(mdia)
+    if b"mdhd" not in mdia_map or b"hdlr" not in mdia_map or b"minf" not in mdia_map:
+        raise Mp4ConcatError("Track without mdhd/hdlr/minf")
+
+    minf_raw, minf_header = mdia_map[b"minf"]
+    minf = _children(minf_raw, 0, minf_header, len(minf_raw))
+    minf_map = _child_map(minf)
+    if b"stbl" not in minf_map:
+        raise Mp4ConcatError("Track without stbl")
+
+    stbl_raw, stbl_header = minf_map[b"stbl"]
+    stbl = _child_map(_children(stbl_raw, 0, stbl_header, len(stbl_raw)))
+    for required in (b"stsd", b"stts", b"stsc", b"stsz"):
+        if required not in stbl:
+            raise Mp4ConcatError(f"Track without {required.decode()}")
+    if b"stco" not in stbl and b"co64" not in stbl:
+        raise Mp4ConcatError("Track without chunk offsets")
+
+    stsd_raw, stsd_header = stbl[b"stsd"]
+    if struct.unpack_from(">I", stsd_raw, stsd_header + 4)[0] != 1:
+        raise Mp4ConcatError("Tracks with multiple sample descriptions are not supported")
+
+    stsz_raw, stsz_header = stbl[b"stsz"]
+    sample_size, sample_count = struct.unpack_from(">II", stsz_raw, stsz_header + 4)
+    if sample_size:
+        sample_sizes = [sample_size] * sample_count
+    else:
+        base = stsz_header + 12
+        if base + sample_count * 4 > len(stsz_raw):
+            raise Mp4ConcatError("Truncated stsz")
+        sample_sizes = list(struct.unpack_from(f">{sample_count}I", stsz_raw, base))
+
+    if b"co64" in stbl:
+        chunk_offsets = [entry[0] for entry in _table(*stbl[b"co64"], ">Q")]
+    else:
+        chunk_offsets = [entry[0] for entry in _table(*stbl[b"stco"], ">I")]
+
+    stsc = _table(*stbl[b"stsc"], ">III")
+    if any(entry[2] != 1 for entry in stsc):
+        raise Mp4ConcatError("Unexpected sample description index")
+
+    ctts = None
+    ctts_version = 0
+    if b"ctts" in stbl:
+        ctts_raw, ctts_header = stbl[b"ctts"]
+        ctts_version = ctts_raw[ctts_header]
+        ctts = _table(ctts_raw, ctts_header, ">Ii" if ctts_version == 1 else ">II")
+
+    stss = None
+    if b"stss" in stbl:
+        stss = [entry[0] for entry in _table(*stbl[b"stss"], ">I")]
+
+    edit = None
+    if b"edts" in trak_map:
+        edts_raw, edts_header = trak_map[b"edts"]
+        edts_map = _child_map(_children(edts_raw, 0, edts_header, len(edts_raw)))
+        if b"elst" in edts_map:
+            elst_raw, elst_header = edts_map[b"elst"]
+            elst_version = elst_raw[elst_header]
+            entries = _table(elst_raw, elst_header, ">QqhH" if elst_version == 1 else ">IihH")
+            if not entries or any(entry[2:] != (1, 0) or entry[1] < 0 for entry in entries):
+                raise Mp4ConcatError("Only plain edit lists without empty edits are supported")
+            edit = (elst_version, [entry[:2] for entry in entries])
+
+    mdhd_raw, mdhd_header = mdia_map[b"mdhd"]
+    tkhd_raw, tkhd_header = trak_map[b"tkhd"]
+    hdlr_raw, hdlr_header = mdia_map[b"hdlr"]
+
+    handler = hdlr_raw[hdlr_header + 8:hdlr_header + 12]
+
+    return {
+        "handler": handler,
+        "trak": trak,
+        "mdia": mdia,
+        "minf": minf,
+        "tkhd": (tkhd_raw, tkhd_header),
+        "mdhd": (mdhd_raw, mdhd_header),
+        "timescale": _read_timescale(mdhd_raw, mdhd_header),
+        "media_duration": _read_duration(mdhd_raw, mdhd_header, 16, 24),
+        "track_duration": _read_duration(tkhd_raw, tkhd_header, 20, 28),
+        "stsd": stsd_raw,
+        "codec": _codec_signature(stsd_raw, stsd_header, handler),
+        "stts": _table(*stbl[b"stts"], ">II"),
+        "ctts": ctts,
+        "ctts_version": ctts_version,
+        "stss": stss,
+        "stsc": stsc,
+        "sample_sizes": sample_sizes,
+        "chunk_offsets": chunk_offsets,
+        "edit": edit,
+    }
+
+
+def _parse_movie(path):
+    top = _read_top_level(path)
+    moov = top[b"moov"]
+    moov_header = 16 if struct.unpack_from(">I", moov)[0] == 1 else 8
+    children = _children(moov, 0, moov_header, len(moov))
+    if any(box_type == b"mvex" for box_type, _, _ in children):
+        raise Mp4ConcatError(f"Fragmented MP4 is not supported: {path}")
+    moov_map = _child_map(children)
+    if b"mvhd" not in moov_map:
+        raise Mp4ConcatError(f"Missing mvhd box in {path}")
+    mvhd_raw, mvhd_header = moov_map[b"mvhd"]
+    tracks = [_parse_track(raw, header_size) for box_type, raw, header_size in children if box_type == b"trak"]
+    if not tracks:
+        raise Mp4ConcatError(f"No tracks in {path}")
+
+    mdat_start, mdat_size = top[b"mdat"]
+    for track in tracks:
+        for offset in track["chunk_offsets"]:
+            if not mdat_start <= offset < mdat_start + mdat_size:
+                raise Mp4ConcatError(f"Chunk outside of mdat in {path}")
+
+    return {
+        "path": path,
+        "ftyp": top[b"ftyp"],
+        "moov": children,
+        "mvhd": (mvhd_raw, mvhd_header),
+        "timescale": _read_timescale(mvhd_raw, mvhd_header),
+        "tracks": tracks,
+        "mdat": (mdat_start, mdat_size),
+    }
+
+
+def _check_compatible(movies):
+    first = movies[0]
+    for movie in movies[1:]:
+        if movie["timescale"] != first["timescale"]:
+            raise Mp4ConcatError("Movie timescales differ")
+        if [t["handler"] for t in movie["tracks"]] != [t["handler"] for t in first["tracks"]]:
+            raise Mp4ConcatError(f"Track layout differs: {movie['path']}")
+        for track, first_track in zip(movie["tracks"], first["tracks"]):
+            if track["codec"] != first_track["codec"]:
+                raise Mp4ConcatError(f"Codec parameters differ: {movie['path']}")
+            if track["timescale"] != first_track["timescale"]:
+                raise Mp4ConcatError(f"Media timescales differ: {movie['path']}")
+            if (track["edit"] is None) != (first_track["edit"] is None):
+                raise Mp4ConcatError(f"Edit lists differ: {movie['path']}")
+
+
+def _merge_track(parts, payload_offsets):
+    """Merge the sample tables of one track across all clips"""
+    stts, ctts, stss, stsc, sample_sizes, chunk_offsets = [], [], [], [], [], []
+    has_ctts = any(part["ctts"] is not None for part in parts)
+    has_stss = any(part["stss"] is not None for part in parts)
+    samples_before = 0
+    for part, (source_start, output_start) in zip(parts, payload_offsets):
+        sample_count = len(part["sample_sizes"])
+        stts.extend(part["stts"])
+        if has_ctts:
+            ctts.extend(part["ctts"] if part["ctts"] is not None else [(sample_count, 0)])
+        if has_stss:
+            numbers = part["stss"] if part["stss"] is not None else range(1, sample_count + 1)
+            stss.extend(number + samples_before for number in numbers)
+        stsc.extend(
+            (first_chunk + len(chunk_offsets), per_chunk, description)
+            for first_chunk, per_chunk, description in part["stsc"]
+        )
+        sample_sizes.extend(part["sample_sizes"])
+        chunk_offsets.extend(offset - source_start + output_start for offset in part["chunk_offsets"])
+        samples_before += sample_count
+
+    boxes = [
+        parts[0]["stsd"],
+        _full_box(b"stts", 0, 0, struct.pack(">I", len(stts)) + b"".join(struct.pack(">II", *e) for e in stts)),
+    ]
+    if has_ctts:
+        version = max(part["ctts_version"] for part in parts)
+        entry_format = ">Ii" if version == 1 else ">II"
+        boxes.append(_full_box(b"ctts", version, 0, struct.pack(">I", len(ctts)) + b"".join(struct.pack(entry_format, *e) for e in ctts)))
+    if has_stss:
+        boxes.append(_full_box(b"stss", 0, 0, struct.pack(f">I{len(stss)}I", len(stss), *stss)))
+    boxes.append(_full_box(b"stsc", 0, 0, struct.pack(">I", len(stsc)) + b"".join(struct.pack(">III", *e) for e in stsc)))
+    boxes.append(_full_box(b"stsz", 0, 0, struct.pack(f">II{len(sample_sizes)}I", 0, len(sample_sizes), *sample_sizes)))
+    # Always use 64-bit offsets so the moov size does not depend on the offsets themselves
+    boxes.append(_full_box(b"co64", 0, 0, struct.pack(f">I{len(chunk_offsets)}Q", len(chunk_offsets), *chunk_offsets)))
+    return _box(b"stbl", b"".join(boxes))
+
+
+def _merge_edits(parts):
+    """Build an elst with one entry per clip, each pointing into the merged media timeline"""
+    # Each clip keeps its own media_time (e.g. the AAC priming FFmpeg skips), so
+    # the priming and padding of later clips stay hidden instead of shifting them
+    entries = []
+    media_start = 0
+    for part in parts:
+        entries.extend((duration, media_start + media_time) for duration, media_time in part["edit"][1])
+        media_start += sum(count * delta for count, delta in part["stts"])
+    fits_version_0 = all(duration <= 0xFFFFFFFF and media_time <= 0x7FFFFFFF for duration, media_time in entries)
+    version = 0 if fits_version_0 else 1
+    entry_format = ">QqhH" if version == 1 else ">IihH"
+    payload = struct.pack(">I", len(entries)) + b"".join(struct.pack(entry_format, duration, media_time, 1, 0) for duration, media_time in entries)
+    return _full_box(b"elst", version, 0, payload)
+
+
+def _build_track(parts, payload_offsets):
+    first = parts[0]
+    track_duration = sum(part["track_duration"] for part in parts)
+    media_duration = sum(part["media_duration"] for part in parts)
+
+    minf = b"".join(
+        _merge_track(parts, payload_offsets) if box_type == b"stbl" else raw
+        for box_type, raw, _ in first["minf"]
+    )
+    mdia = b"".join(
+        _with_duration(*first["mdhd"], 16, 24, media_duration) if box_type == b"mdhd"
+        else _box(b"minf", minf) if box_type == b"minf"
+        else raw
+        for box_type, raw, _ in first["mdia"]
+    )
+
+    trak = []
+    for box_type, raw, _ in first["trak"]:
+        if box_type == b"tkhd":
+            trak.append(_with_duration(*first["tkhd"], 20, 28, track_duration))
+        elif box_type == b"edts":
+            if first["edit"] is None:
+                continue
+            trak.append(_box(b"edts", _merge_edits(parts)))
+        elif box_type == b"mdia":
+            trak.append(_box(b"mdia", mdia))
+        else:
+            trak.append(raw)
+    return _box(b"trak", b"".join(trak)), track_duration
+
+
+def _build_moov(movies, payload_offsets):
+    first = movies[0]
+    traks = []
+    movie_duration = 0
+    for index in range(len(first["tracks"])):
+        trak, duration = _build_track([movie["tracks"][index] for movie in movies], payload_offsets)
+        traks.append(trak)
+        movie_duration = max(movie_duration, duration)
+
+    moov = []
+    for box_type, raw, _ in first["moov"]:
+        if box_type == b"mvhd":
+            moov.append(_with_duration(*first["mvhd"], 16, 24, movie_duration))
+        elif box_type == b"trak":
+            if traks:
+                moov.extend(traks)
+                traks = []
+        else:
+            moov.append(raw)
+    return _box(b"moov", b"".join(moov))
+
+
+def concat_mp4(input_paths, output_path):
+    """Concatenate MP4 files sharing codec parameters into output_path"""
+    if not input_paths:
+        raise Mp4ConcatError("No input files")
+    try:
+        movies = [_parse_movie(str(path)) for path in input_paths]
+    except (struct.error, IndexError) as e:
+        raise Mp4ConcatError(f"Malformed MP4: {e}") from e
+    _check_compatible(movies)
+
+    # Lay out the output as ftyp, moov, mdat so playback can start immediately.
+    # The moov size does not depend on the offset values, so build it once with
+    # placeholder offsets to learn where the media data will start.
+    ftyp = movies[0]["ftyp"]
+    placeholder = [(movie["mdat"][0], 0) for movie in movies]
+    payload_start = len(ftyp) + len(_build_moov(movies, placeholder)) + 16
+
+    payload_offsets = []
+    position = payload_start
+    for movie in movies:
+        mdat_start, mdat_size = movie["mdat"]
+        payload_offsets.append((mdat_start, position))
+        position += mdat_size
+    moov = _build_moov(movies, payload_offsets)
+    payload_size = position - payload_start
+
+    with open(output_path, "wb") as out:
+        out.write(ftyp)
+        out.write(moov)
+        out.write(struct.pack(">I4sQ", 1, b"mdat", 16 + payload_size))
+        for movie in movies:
+            mdat_start, mdat_size = movie["mdat"]
+            with open(movie["path"], "rb") as src:
+                src.seek(mdat_start)
+                remaining = mdat_size
+                while remaining:
+                    chunk = src.read(min(COPY_BUFFER_SIZE, remaining))
+                    if not chunk:
+                        raise Mp4ConcatError(f"Unexpected end of file: {movie['path']}")
+                    out.write(chunk)
+                    remaining -= len(chunk)
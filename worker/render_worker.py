@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Long-lived Manim render process for the 3D Avatar Manim Worker.
+
+Imports Manim once, then renders one scene per JSON job read from stdin and
+answers each job with one JSON line on stdout, preceded by a progress line
+({"event": "progress", ...}) after every animation. Manim's own console output is
+redirected to stderr so it cannot interleave with the replies.
+
+Each process compiles Tex in its own tex_dir and publishes finished SVGs into
+the shared AI_TUTOR_TEX_DIR, so a formula is only compiled once per worker.
+
+With AI_TUTOR_MATHJAX=1, math is typeset by a long-lived MathJax process
+(mathjax/tex2svg.js) instead of latex + dvisvgm.
+"""
+import os
+import re
+import sys
+import json
+import hashlib
+import importlib.util
+import subprocess
+import traceback
+from pathlib import Path
+
+# Keep the real stdout for replies and send everything else to stderr
+replies = os.fdopen(os.dup(sys.stdout.fileno()), "w", buffering=1, encoding="utf-8")
+os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+from manim import config, tempconfig
+
+# Manim quality flags as accepted by the CLI (-ql, -qm, ...) mapped to config values
+QUALITY_NAMES = {
+    "l": "low_quality",
+    "m": "medium_quality",
+    "h": "high_quality",
+    "k": "fourk_quality"
+}
+
+MATHJAX_SCRIPT = Path(__file__).parent / "mathjax" / "tex2svg.js"
+
+# Environments Manim typesets in math mode; anything else (Tex's "center") needs LaTeX
+MATH_ENVIRONMENTS = {"align*", "equation*", "gather*", "align", "equation", "gather"}
+
+SVG_VIEWBOX_RE = re.compile(r'viewBox="([-\d.]+) ([-\d.]+) ([-\d.]+) ([-\d.]+)"')
+SVG_SIZE_RE = re.compile(r'\b(width|height)="[^"]*"')
+
+def svg_in_points(svg):
+    """Give a MathJax SVG the absolute size dvisvgm would, since Manim scales Tex by its SVG size"""
+    # MathJax viewBox units are 1/1000 em, and LaTeX's 10pt default font makes 1 em = 10pt
+    root_tag, _, body = svg.partition(">")
+    _, _, width, height = (float(value) for value in SVG_VIEWBOX_RE.search(root_tag).groups())
+    size = {"width": f"{width / 100:.3f}pt", "height": f"{height / 100:.3f}pt"}
+    root_tag = SVG_SIZE_RE.sub(lambda match: f'{match.group(1)}="{size[match.group(1)]}"', root_tag)
+    return f"{root_tag}>{body}"
+
+def shared_tex_dir():
+    """Directory holding the SVGs shared by all render processes"""
+    return Path(os.environ.get("AI_TUTOR_TEX_DIR") or config.get_dir("tex_dir"))
+
+def share_tex_cache():
+    """Look up compiled Tex SVGs in the shared directory and publish new ones there"""
+    from manim.mobject.text import tex_mobject
+    from manim.utils import tex_file_writing
+    compile_to_svg_file = tex_mobject.tex_to_svg_file
+    
+    def tex_to_svg_file(expression, environment=None, tex_template=None):
+        # Manim names the SVG after a hash of the generated .tex source
+        tex_file = tex_file_writing.generate_tex_file(expression, environment, tex_template)
+        shared_svg = shared_tex_dir() / tex_file.with_suffix(".svg").name
+        if shared_svg.exists():
+            return shared_svg
+        
+        # Compile in this process's tex_dir, where Manim may delete its own
+        # intermediates, then publish the finished SVG in one atomic step
+        os.replace(compile_to_svg_file(expression, environment, tex_template), shared_svg)
+        return shared_svg
+    
+    tex_mobject.tex_to_svg_file = tex_to_svg_file
+
+def use_mathjax():
+    """Typeset math with a long-lived MathJax process, keeping LaTeX for text-mode Tex"""
+    from manim.mobject.text import tex_mobject
+    latex_to_svg_file = tex_mobject.tex_to_svg_file
+    mathjax = subprocess.Popen(
+        ["node", str(MATHJAX_SCRIPT)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+        encoding="utf-8"
+    )
+    
+    def tex_to_svg_file(expression, environment=None, tex_template=None):
+        if environment not in MATH_ENVIRONMENTS:
+            return latex_to_svg_file(expression, environment, tex_template)
+        
+        key = hashlib.sha256(f"{environment}\0{expression}".encode("utf-8")).hexdigest()[:16]
+        svg_file = shared_tex_dir() / f"mathjax_{key}.svg"
+        if svg_file.exists():
+            return svg_file
+        
+        try:
+            mathjax.stdin.write(json.dumps({"tex": f"\\begin{{{environment}}}{expression}\\end{{{environment}}}"}) + "\n")
+            mathjax.stdin.flush()
+            reply = json.loads(mathjax.stdout.readline())
+        except (OSError, ValueError):
+            reply = {"error": "MathJax process is not running"}
+        if "svg" not in reply:
+            print(f"⚠️ MathJax failed ({reply['error']}), using LaTeX: {expression}", file=sys.stderr)
+            return latex_to_svg_file(expression, environment, tex_template)
+        
+        # Manim only checks that the SVG exists, so never expose a half-written file
+        partial = svg_file.with_suffix(f".{os.getpid()}.part")
+        partial.parent.mkdir(parents=True, exist_ok=True)
+        partial.write_text(svg_in_points(reply["svg"]), encoding="utf-8")
+        os.replace(partial, svg_file)
+        return svg_file
+    
+    tex_mobject.tex_to_svg_file = tex_to_svg_file
+
+def send(message):
+    replies.write(json.dumps(message) + "\n")
+
+def report_progress(scene):
+    """Send a progress line each time the scene finishes an animation (wait() included)"""
+    play = scene.play
+    
+    def play_and_report(*args, **kwargs):
+        play(*args, **kwargs)
+        send({"event": "progress", "animations": scene.renderer.num_plays})
+    
+    scene.play = play_and_report
+
+def render(job):
+    """Render the scene described by a job and return the path of the movie file"""
+    os.chdir(job["cwd"])
+
+    with tempconfig({
+        "input_file": job["script"],
+        "output_file": job["output_file"],
+        "media_dir": job["media_dir"],
+        "tex_dir": job["tex_dir"],
+        "quality": QUALITY_NAMES[job["quality"]],
+        "verbosity": "WARNING",  # Per-animation INFO lines only flood the worker's console
+        "disable_caching": False  # Reuse partial movies of animations rendered before
+    }):
+        # Run the script inside tempconfig so config changes made by the scene code are undone
+        spec = importlib.util.spec_from_file_location("scene", job["script"])
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        scene = getattr(module, job["scene"])()
+        report_progress(scene)
+        scene.render()
+        return str(scene.renderer.file_writer.movie_file_path)
+
+def main():
+    # Every scene script is run once from a throwaway directory; a .pyc would never be reused
+    sys.dont_write_bytecode = True
+    share_tex_cache()
+    if os.environ.get("AI_TUTOR_MATHJAX") == "1":
+        use_mathjax()
+    print(f"✅ Render process {os.getpid()} ready", file=sys.stderr)
+    for line in sys.stdin:
+        job = json.loads(line)
+        try:
+            reply = {"success": True, "video": render(job)}
+        except (Exception, SystemExit):
+            reply = {"success": False, "error": traceback.format_exc()}
+        send(reply)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Tests for the in-process MP4 concatenation (run with: python -m unittest discover worker/tests)"""
+
+import array
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mp4_concat import Mp4ConcatError, concat_mp4, _parse_movie  # noqa: E402
+
+FFMPEG = shutil.which("ffmpeg")
+SAMPLE_RATE = 48000
+
+
+def ffmpeg(*args):
+    subprocess.run([FFMPEG, "-y", "-v", "error", *args], check=True, capture_output=True)
+
+
+def make_clip(path, seconds=1, tone=440, audio=True, vcodec="libx264"):
+    """Render a test clip; tone=None gives a silent audio track"""
+    args = ["-f", "lavfi", "-i", f"testsrc=size=160x120:rate=25:duration={seconds}"]
+    if audio:
+        source = f"sine=frequency={tone}:sample_rate={SAMPLE_RATE}" if tone else f"anullsrc=r={SAMPLE_RATE}:cl=mono"
+        args += ["-f", "lavfi", "-i", f"{source}:duration={seconds}" if tone else source, "-t", str(seconds), "-c:a", "aac"]
+    args += ["-c:v", vcodec, "-pix_fmt", "yuv420p", str(path)]
+    ffmpeg(*args)
+    return path
+
+
+def decode_audio(path):
+    """Decode the audio track to mono 16-bit samples"""
+    result = subprocess.run(
+        [FFMPEG, "-v", "error", "-i", str(path), "-map", "0:a:0", "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"],
+        check=True, capture_output=True,
+    )
+    return array.array("h", result.stdout)
+
+
+def count_frames(path):
+    result = subprocess.run(
+        [FFMPEG, "-v", "error", "-i", str(path), "-map", "0:v:0", "-f", "framemd5", "-"],
+        check=True, capture_output=True, text=True,
+    )
+    return sum(1 for line in result.stdout.splitlines() if line and not line.startswith("#"))
+
+
+def silent_runs(samples, window=96, threshold=100):
+    """Return the start times in seconds of windows that switch between tone and silence"""
+    edges = []
+    previous = None
+    for start in range(0, len(samples) - window, window):
+        quiet = max(abs(value) for value in samples[start:start + window]) < threshold
+        if previous is not None and quiet != previous:
+            edges.append(start / SAMPLE_RATE)
+        previous = quiet
+    return edges
+
+
+@unittest.skipUnless(FFMPEG, "ffmpeg is not installed")
+class ConcatMp4Test(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_video_only(self):
+        clips = [make_clip(self.tmp / f"v{i}.mp4", audio=False) for i in range(3)]
+        out = self.tmp / "out.mp4"
+        concat_mp4(clips, out)
+
+        self.assertEqual(count_frames(out), 75)
+        self.assertEqual(len(_parse_movie(str(out))["tracks"]), 1)
+
+    def test_audio_keeps_each_clip_in_sync(self):
+        # tone, silence, tone: the edges must land on the clip boundaries
+        clips = [
+            make_clip(self.tmp / "a0.mp4", tone=440),
+            make_clip(self.tmp / "a1.mp4", tone=None),
+            make_clip(self.tmp / "a2.mp4", tone=880),
+        ]
+        out = self.tmp / "out.mp4"
+        concat_mp4(clips, out)
+
+        sources = [_parse_movie(str(clip))["tracks"][1]["edit"][1] for clip in clips]
+        self.assertTrue(all(edits[0][1] > 0 for edits in sources), "expected AAC priming in the sources")
+        audio = _parse_movie(str(out))["tracks"][1]
+        self.assertEqual(audio["handler"], b"soun")
+        self.assertEqual(len(audio["edit"][1]), 3)
+
+        edges = silent_runs(decode_audio(out))
+        self.assertGreaterEqual(len(edges), 2, edges)
+        for edge, expected in zip(edges, (1.0, 2.0)):
+            self.assertAlmostEqual(edge, expected, delta=0.01)
+
+        expected_samples = sum(len(decode_audio(clip)) for clip in clips)
+        self.assertAlmostEqual(len(decode_audio(out)), expected_samples, delta=SAMPLE_RATE // 100)
+        self.assertEqual(count_frames(out), 75)
+
+    def test_mismatched_codecs(self):
+        clips = [
+            make_clip(self.tmp / "h264.mp4", audio=False),
+            make_clip(self.tmp / "mpeg4.mp4", audio=False, vcodec="mpeg4"),
+        ]
+        with self.assertRaises(Mp4ConcatError):
+            concat_mp4(clips, self.tmp / "out.mp4")
+        self.assertFalse((self.tmp / "out.mp4").exists())
+
+    def test_co64_inputs(self):
+        # concat_mp4 always writes co64, so joining its own outputs covers 64-bit chunk offsets
+        clips = [make_clip(self.tmp / f"c{i}.mp4") for i in range(2)]
+        first = self.tmp / "first.mp4"
+        second = self.tmp / "second.mp4"
+        concat_mp4(clips, first)
+        concat_mp4(clips, second)
+        with open(first, "rb") as f:
+            self.assertIn(b"co64", f.read())
+
+        out = self.tmp / "out.mp4"
+        concat_mp4([first, second], out)
+        self.assertEqual(count_frames(out), 100)
+        self.assertAlmostEqual(len(decode_audio(out)), 2 * len(decode_audio(first)), delta=SAMPLE_RATE // 100)
+
+
+if __name__ == "__main__":
+    unittest.main()